@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 from stackstate_etl.etl.etl_driver import ETLDriver
 from stackstate_etl.model.factory import TopologyFactory
@@ -13,13 +14,27 @@ class CliProcessor:
         self.stackstate: StackStateClient = StackStateClient(config.stackstate)
         self.factory: TopologyFactory = TopologyFactory()
         self.log = logging.getLogger()
+        self.driver: Optional[ETLDriver] = None
 
     def run(self, dry_run=False) -> SyncStats:
-        processor = ETLDriver(self.config, self.factory, self.log)
-        processor.process()
-        stats = self.stackstate.publish(
-            list(self.factory.components.values()), list(self.factory.relations.values()), dry_run
-        )
+        if self.driver is None:
+            self.driver = ETLDriver(self.config, self.factory, self.log)
+        else:
+            # Later runs reuse the loaded models and datasources, and only start from an empty factory.
+            self.factory = TopologyFactory()
+            self.driver.reset(self.factory)
+        self.driver.process()
+        # The factory holds lightweight components; the receiver models are only built here.
+        components = [component.to_model() for component in self.factory.components.values()]
+        stats = self.stackstate.publish(components, list(self.factory.relations.values()), dry_run, stats=SyncStats())
+        stats.relation_resolution = self.factory.relation_stats
+        stats.events_deduplicated = self.factory.events.deduplicated
+        stats.events_dropped = self.factory.events.dropped
         self.stackstate.publish_health_checks(list(self.factory.health.values()), dry_run=dry_run, stats=stats)
         self.stackstate.publish_events(self.factory.events, dry_run=dry_run, stats=stats)
         return self.stackstate.publish_metrics(self.factory.metrics, dry_run=dry_run, stats=stats)
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.close()
+            self.driver = None
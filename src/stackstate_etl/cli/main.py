@@ -2,16 +2,19 @@ import json
 import logging
 import os
 import time
+from typing import Optional
 
 import click
-import yaml
 from schematics.exceptions import DataError
 
 from stackstate_etl.cli.cli_processor import CliProcessor
+from stackstate_etl.etl.model_cache import load_yaml
 from stackstate_etl.model.instance import CliConfiguration
 
 
-def run(conf: str, log_level: str, dry_run: bool, repeat: bool, work_dir: str, repeat_interval: int):
+def run(
+    conf: str, log_level: str, dry_run: bool, repeat: bool, work_dir: str, repeat_interval: int, daemon: bool = False
+):
     logging.basicConfig(
         level=log_level.upper(),
         format="%(asctime)s - %(name)s (%(lineno)s) - %(levelname)s: %(message)s",
@@ -22,7 +25,10 @@ def run(conf: str, log_level: str, dry_run: bool, repeat: bool, work_dir: str, r
         os.chdir(work_dir)
         click.echo("Current working directory: {0}".format(os.getcwd()))
 
-    if repeat:
+    if daemon:
+        click.echo("Running in daemon mode.")
+        return _daemon_run(conf, dry_run, repeat_interval)
+    elif repeat:
         click.echo("Running in repeat mode.")
         while True:
             _internal_run(conf, dry_run)
@@ -33,21 +39,51 @@ def run(conf: str, log_level: str, dry_run: bool, repeat: bool, work_dir: str, r
         _internal_run(conf, dry_run)
 
 
+def _daemon_run(conf: str, dry_run: bool, repeat_interval: int):
+    # Configuration, models, templates and datasources are loaded once and reused by every cycle.
+    configuration = _load_configuration(conf)
+    if configuration is None:
+        return 1
+    processor = CliProcessor(configuration)
+    try:
+        while True:
+            _sync(processor, dry_run)
+            click.echo(f"Will repeat after {repeat_interval} seconds.")
+            time.sleep(repeat_interval)
+            click.echo("Repeating...")
+    finally:
+        processor.close()
+
+
 def _internal_run(conf: str, dry_run: bool):
+    configuration = _load_configuration(conf)
+    if configuration is None:
+        return 1
+    processor = CliProcessor(configuration)
+    try:
+        _sync(processor, dry_run)
+    finally:
+        processor.close()
+
+
+def _load_configuration(conf: str) -> Optional[CliConfiguration]:
     click.echo(f"Loading configuration from {conf}")
     with open(conf) as f:
-        dict_config = yaml.safe_load(f)
+        dict_config = load_yaml(f)
     try:
         configuration = CliConfiguration(dict_config)
         configuration.validate()
     except DataError as e:
         click.echo("Failed to load configuration:", err=True)
         click.echo(json.dumps(e.to_primitive(), indent=4), err=True)
-        return 1
+        return None
+    return configuration
+
 
+def _sync(processor: CliProcessor, dry_run: bool):
     if dry_run:
         click.echo("Running ETL sync in dry-run mode")
-        result = CliProcessor(configuration).run(dry_run)
+        result = processor.run(dry_run)
         click.echo("Discovered Components, Relations, Metrics, Events, Health information:")
         click.echo("-" * 80)
         for payload in result.payloads:
@@ -55,12 +91,20 @@ def _internal_run(conf: str, dry_run: bool):
             click.echo("-" * 80)
     else:
         click.echo("Running ETL sync")
-        result = CliProcessor(configuration).run()
+        result = processor.run()
 
     click.echo("-" * 80)
     click.echo(f"Total Components = {result.components}.")
     click.echo(f"Total Relations = {result.relations}.")
+    if result.relation_resolution is not None:
+        resolution = result.relation_resolution
+        click.echo(
+            f"Relations resolved by uid = {resolution.resolved_by_uid}, by name = {resolution.resolved_by_name},"
+            f" by identifier = {resolution.resolved_by_identifier}, unresolved = {resolution.unresolved}."
+        )
     click.echo(f"Total Events = {result.events}.")
+    if result.events_deduplicated or result.events_dropped:
+        click.echo(f"Events deduplicated = {result.events_deduplicated}, dropped = {result.events_dropped}.")
     click.echo(f"Total Metrics = {result.metrics}.")
     click.echo(f"Total Health Syncs = {result.checks}.")
     click.echo("-" * 80)
@@ -74,8 +118,13 @@ def _internal_run(conf: str, dry_run: bool):
 @click.option("--repeat", is_flag=True, help="Runs topology sync as specified by the --repeat-interval")
 @click.option("--work-dir", default=".", help="Set the current working directory")
 @click.option("--repeat-interval", default="30", type=int, help="Repeat interval in seconds. Default 30.")
-def cli(conf: str, log_level: str, dry_run: bool, repeat: bool, work_dir: str, repeat_interval: int):
-    return run(conf, log_level, dry_run, repeat, work_dir, repeat_interval)
+@click.option(
+    "--daemon",
+    is_flag=True,
+    help="Repeat mode that keeps configuration, templates and datasources loaded between runs",
+)
+def cli(conf: str, log_level: str, dry_run: bool, repeat: bool, work_dir: str, repeat_interval: int, daemon: bool):
+    return run(conf, log_level, dry_run, repeat, work_dir, repeat_interval, daemon)
 
 
 def main():
@@ -3,37 +3,121 @@ import logging
 import os
 import pathlib
 from logging import Logger
-from typing import Any, Dict, List
+from multiprocessing.pool import ThreadPool
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
-import yaml
 from importlib_resources import files
 
+from stackstate_etl.etl.eventloop import EventLoopRunner, is_async
 from stackstate_etl.etl.interpreter import (
+    BaseTemplateInterpreter,
+    CompiledTemplate,
     ComponentTemplateInterpreter,
     DataSourceInterpreter,
     EventTemplateInterpreter,
     HeathTemplateInterpreter,
+    InterpreterPool,
     MetricTemplateInterpreter,
     ProcessorInterpreter,
     ProcessorTemplateInterpreter,
     QueryInterpreter,
     QueryProcessorInterpreter,
+    QueryResults,
     TopologyContext,
+    expression_cache,
 )
+from stackstate_etl.etl.model_cache import ModelCache, load_yaml
+from stackstate_etl.etl.parallel import interpret_in_processes
 from stackstate_etl.model.etl import (
     ETL,
+    ITEM_DISPATCH,
     ComponentTemplate,
     EventTemplate,
     HealthTemplate,
     MetricTemplate,
+    ProcessorSpec,
     ProcessorTemplate,
     Query,
 )
+from stackstate_etl.model.events import EventBuffer
 from stackstate_etl.model.factory import LENIENT, STRICT, TopologyFactory
 from stackstate_etl.model.instance import InstanceInfo
+from stackstate_etl.model.metrics import MetricRollups
+
+STREAM_SHARD_CHUNK_SIZE = 10000
+
+
+class CountingIterator:
+    def __init__(self, items: Iterable[Any]):
+        self.items = iter(items)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        item = next(self.items)
+        self.count += 1
+        return item
+
+    next = __next__  # Python 2.7
+
+
+def chunked(items: Iterable[Any], size: int) -> Generator[List[Any], None, None]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SelectorIndex:
+    """
+    Hash index over the field selectors of a query's templates. Each item is routed to its matching templates with
+    one jsonpath lookup per distinct field, instead of evaluating every template selector.
+    """
+
+    def __init__(self, templates: List[Optional[CompiledTemplate]]):
+        self.fields: Dict[str, Dict[Any, List[int]]] = {}
+        self.indexed: Set[int] = set()
+        for position, compiled in enumerate(templates):
+            if compiled is None or compiled.field_selector is None:
+                continue
+            values = self.fields.setdefault(compiled.field_selector.field, {})
+            for value in compiled.field_selector.values:
+                values.setdefault(value, []).append(position)
+            self.indexed.add(position)
+
+    def route(self, factory: TopologyFactory, item: Any) -> Set[int]:
+        selected: Set[int] = set()
+        for field, values in self.fields.items():
+            try:
+                positions = values.get(factory.jpath(field, item), None)
+            except TypeError:
+                # Unhashable values, like lists and dicts, never match.
+                positions = None
+            if positions:
+                selected.update(positions)
+        return selected
 
 
 class TemplateLookup:
+    TEMPLATE_TYPES = ["component", "processor", "event", "metric", "health"]
+
     def __init__(self):
         self.log: Logger = logging.getLogger()
         self.component: Dict[str, ComponentTemplate] = {}
@@ -41,6 +125,26 @@ class TemplateLookup:
         self.event: Dict[str, EventTemplate] = {}
         self.metric: Dict[str, MetricTemplate] = {}
         self.health: Dict[str, HealthTemplate] = {}
+        self.compiled: Dict[str, Dict[str, CompiledTemplate]] = {}
+        self.selector_indexes: Dict[Tuple[str, ...], SelectorIndex] = {}
+
+    def get_compiled(self, attr_name: str, key: str) -> CompiledTemplate:
+        return self.compiled[attr_name][key]
+
+    def find_compiled(self, key: str) -> Optional[CompiledTemplate]:
+        for attr_name in self.TEMPLATE_TYPES:
+            compiled = self.compiled.get(attr_name, {}).get(key, None)
+            if compiled is not None:
+                return compiled
+        return None
+
+    def selector_index(self, template_refs: List[str]) -> SelectorIndex:
+        key = tuple(template_refs)
+        index = self.selector_indexes.get(key, None)
+        if index is None:
+            index = SelectorIndex([self.find_compiled(ref) for ref in template_refs])
+            self.selector_indexes[key] = index
+        return index
 
     def index(self, etl: ETL):
         def add(attr_name: str, key: str, value: Any):
@@ -52,6 +156,7 @@ class TemplateLookup:
                 )
             else:
                 item[key] = value
+                self.compiled.setdefault(attr_name, {})[key] = CompiledTemplate(value)
 
         def add_all(attr_name: str, items: List[Any]):
             for item in items:
@@ -69,18 +174,45 @@ class ETLDriver:
     def __init__(self, conf: InstanceInfo, factory: TopologyFactory, log: Logger):
         self.log = log
         self.factory = factory
-        self.factory.log = log
         self.conf = conf
+        self._configure_factory()
         conf.etl.source = "conf.yaml"
+        self.model_cache = ModelCache(conf.model_cache_dir) if conf.model_cache_dir else None
         self.models = self._init_model(conf.etl)
+        self._check_parallel_queries()
+        self.metric_rollups = MetricRollups([rollup for model in self.models for rollup in model.metric_rollups])
         self.template_lookup = self._init_template_lookup()
+        self.interpreter_pool = InterpreterPool()
+        self.event_loop = EventLoopRunner()
+        self.datasources: Dict[str, Any] = {}
+
+    def reset(self, factory: TopologyFactory):
+        """
+        Starts a new cycle that processes into `factory`. Models, templates, compiled expressions and datasource
+        instances are kept, so a long-running process only pays for them once.
+        """
+        self.factory = factory
+        self._configure_factory()
+
+    def _configure_factory(self):
+        self.factory.log = self.log
+        self.factory.incremental_relations = self.conf.incremental_relations
+        self.factory.validation = self.conf.validation_policy
+        self.factory.validation_sample_rate = self.conf.validation_sample_rate
+        self.factory.events = EventBuffer(
+            self.conf.event_dedup_key,
+            self.conf.event_dedup_window_seconds,
+            self.conf.max_events,
+            self.conf.event_drop_policy,
+        )
 
     def process(self):
-        global_datasources: Dict[str, Any] = {}
         global_session: Dict[str, Any] = {}
         for model in self.models:
-            processor = ETLProcessor(model, self.template_lookup, self.conf, self.factory, self.log)
-            ctx = TopologyContext(factory=self.factory, datasources=global_datasources, global_session=global_session)
+            processor = ETLProcessor(
+                model, self.template_lookup, self.conf, self.factory, self.log, self.interpreter_pool, self.event_loop
+            )
+            ctx = TopologyContext(factory=self.factory, datasources=self.datasources, global_session=global_session)
             processor.process(ctx)
 
         unmerged_components = [c.uid for c in self.factory.components.values() if c.mergeable]
@@ -92,7 +224,34 @@ class ETLDriver:
                 self.log.warning(msg)
             else:
                 self.log.debug(msg)
-        self.factory.resolve_relations()
+        relation_stats = self.factory.resolve_relations()
+        self.log.info(
+            f"Resolved relations: {relation_stats.resolved_by_uid} by uid, {relation_stats.resolved_by_name} by name,"
+            f" {relation_stats.resolved_by_identifier} by identifier, {relation_stats.unresolved} unresolved."
+        )
+        validated = self.factory.validate_components()
+        if validated:
+            self.log.info(f"Validated {validated} components.")
+        if self.metric_rollups:
+            points = len(self.factory.metrics)
+            self.factory.metrics = self.metric_rollups.apply(self.factory.metrics)
+            self.log.info(f"Rolled up {points} metric points into {len(self.factory.metrics)}.")
+        self.log.debug(f"Expression cache statistics: {expression_cache.info()}")
+        self.log.debug(f"Interpreters created by pool: {self.interpreter_pool.created}")
+
+    def close(self):
+        self.event_loop.close()
+
+    def _check_parallel_queries(self):
+        # Worker processes are forked, which is only safe when no query threads of the parent are running.
+        if (self.conf.template_workers or 1) <= 1 or (self.conf.query_concurrency or 1) <= 1:
+            return
+        for model in self.models:
+            for query in model.queries:
+                if query.parallel:
+                    raise Exception(
+                        f"Query '{query.name}' [{model.source}] cannot be parallel when query_concurrency is above 1."
+                    )
 
     def _init_template_lookup(self) -> TemplateLookup:
         lookup = TemplateLookup()
@@ -125,19 +284,38 @@ class ETLDriver:
             )
         results = []
         for yaml_file in yaml_files:
-            with open(str(yaml_file)) as f:
-                etl_data = yaml.safe_load(f)
-            etl_model = ETL(etl_data["etl"])
-            etl_model.source = str(yaml_file)
-            etl_model.validate()
-            results.extend(self._init_model(etl_model))
+            results.extend(self._init_model(self._load_model(str(yaml_file))))
         return results
 
+    def _load_model(self, yaml_file: str) -> ETL:
+        cache = self.model_cache if os.path.isfile(yaml_file) else None
+        if cache is not None:
+            cached = cache.load(yaml_file)
+            if cached is not None:
+                return ETL(cached)
+        with open(yaml_file) as f:
+            etl_data = load_yaml(f)
+        etl_model = ETL(etl_data["etl"])
+        etl_model.source = yaml_file
+        etl_model.validate()
+        if cache is not None:
+            cache.store(yaml_file, etl_model.to_native())
+        return etl_model
+
 
 class ETLProcessor:
     def __init__(
-        self, etl: ETL, template_lookup: TemplateLookup, conf: InstanceInfo, factory: TopologyFactory, log: Logger
+        self,
+        etl: ETL,
+        template_lookup: TemplateLookup,
+        conf: InstanceInfo,
+        factory: TopologyFactory,
+        log: Logger,
+        pool: Optional[InterpreterPool] = None,
+        event_loop: Optional[EventLoopRunner] = None,
     ):
+        self.pool = pool
+        self.event_loop = event_loop if event_loop is not None else EventLoopRunner()
         self.template_lookup = template_lookup
         self.factory = factory
         self.log = log
@@ -153,64 +331,259 @@ class ETLProcessor:
     def _process_queries(self, ctx: TopologyContext):
         counters: Dict[str, int] = {}
         self._init_datasources(ctx)
-        query_post_processor = QueryProcessorInterpreter(ctx)
-        for query_spec in self.etl.queries:
-            query_results = self._get_query_result(ctx, query_spec)
-            if query_results is None or len(query_results) == 0:
-                self.log.warning(f"Query {query_spec.name} returned no results! Check query logic in template.")
-            counters[f"Query_`{query_spec.name}`_Items"] = len(query_results)
+        query_runs = self._run_queries(ctx)
+        try:
+            for query_spec, query_results in query_runs:
+                if isinstance(query_results, list):
+                    item_count = len(query_results)
+                    processed_by_counter = self._interpret_list(ctx, query_spec, query_results)
+                else:
+                    stream = CountingIterator(query_results)
+                    processed_by_counter = self._interpret_stream(ctx, query_spec, stream)
+                    item_count = stream.count
+                if item_count == 0:
+                    self.log.warning(f"Query {query_spec.name} returned no results! Check query logic in template.")
+                counters[f"Query_`{query_spec.name}`_Items"] = item_count
+                if processed_by_counter == 0:
+                    self.log.warning(f"Unprocessed Count for Query {query_spec.name} is 0")
+        finally:
+            query_runs.close()
+
+        self.log.info(f"Query Template Processing Counters:\n{counters}")
+
+    def _interpret_list(self, ctx: TopologyContext, query_spec: Query, query_results: List[Dict[str, Any]]) -> int:
+        workers = self.conf.template_workers or 1
+        if query_spec.parallel and workers > 1:
+            return interpret_in_processes(
+                ctx.factory,
+                query_results,
+                workers,
+                lambda factory, items: self._interpret_shard(ctx, factory, query_spec, items, query_spec.dispatch),
+            )
+        return self._interpret_results(ctx, query_spec, query_results, self.pool, query_spec.dispatch)
+
+    def _interpret_stream(self, ctx: TopologyContext, query_spec: Query, stream: Iterator[Dict[str, Any]]) -> int:
+        # A stream can only be walked once, so its items always go through all templates in a single pass.
+        workers = self.conf.template_workers or 1
+        if query_spec.parallel and workers > 1:
             processed_by_counter = 0
+            for chunk in chunked(stream, STREAM_SHARD_CHUNK_SIZE):
+                processed_by_counter += interpret_in_processes(
+                    ctx.factory,
+                    chunk,
+                    workers,
+                    lambda factory, items: self._interpret_shard(ctx, factory, query_spec, items, ITEM_DISPATCH),
+                )
+            return processed_by_counter
+        return self._interpret_results(ctx, query_spec, stream, self.pool, ITEM_DISPATCH)
+
+    def _interpret_shard(
+        self,
+        ctx: TopologyContext,
+        factory: TopologyFactory,
+        query_spec: Query,
+        items: List[Dict[str, Any]],
+        dispatch: str,
+    ) -> int:
+        shard_ctx = TopologyContext(
+            factory=factory, datasources=ctx.datasources, session=ctx.session, global_session=ctx.global_session
+        )
+        return self._interpret_results(shard_ctx, query_spec, items, InterpreterPool(), dispatch)
+
+    def _interpret_results(
+        self,
+        ctx: TopologyContext,
+        query_spec: Query,
+        query_results: Iterable[Dict[str, Any]],
+        pool: Optional[InterpreterPool],
+        dispatch: str,
+    ) -> int:
+        query_post_processor = QueryProcessorInterpreter(ctx, pool)
+        interpreters = []
+        try:
             for template_ref in query_spec.template_refs:
-                interpreter = self._get_interpreter(ctx, template_ref)
+                interpreters.append(self._get_interpreter(ctx, template_ref, pool))
+            selector_index = self.template_lookup.selector_index(query_spec.template_refs)
+            if dispatch == ITEM_DISPATCH:
+                return self._dispatch_by_item(
+                    ctx, query_spec, query_results, interpreters, selector_index, query_post_processor
+                )
+            return self._dispatch_by_template(
+                ctx,
+                query_spec,
+                query_results if isinstance(query_results, list) else list(query_results),
+                interpreters,
+                selector_index,
+                query_post_processor,
+            )
+        finally:
+            for interpreter in interpreters:
+                interpreter.release()
+            query_post_processor.release()
+
+    def _run_queries(self, ctx: TopologyContext) -> Generator[Tuple[Query, QueryResults], None, None]:
+        queries = self.etl.queries
+        if self.conf.async_queries:
+            for query_spec, query_results in self._run_async_queries(ctx, queries):
+                yield query_spec, query_results
+            return
+        concurrency = min(self.conf.query_concurrency or 1, len(queries))
+        if concurrency <= 1:
+            for query_spec in queries:
+                yield query_spec, self._await_query_result(query_spec, self._get_query_result(ctx, query_spec))
+            return
+        # Queries run concurrently, but their results are interpreted in declaration order.
+        self.log.info(f"Running {len(queries)} queries from {self.etl.source} with concurrency {concurrency}.")
+        thread_pool = ThreadPool(processes=concurrency)
+        try:
+            pending = [(q, thread_pool.apply_async(self._get_query_result, (ctx, q))) for q in queries]
+            for query_spec, result in pending:
+                yield query_spec, self._await_query_result(query_spec, result.get())
+        finally:
+            thread_pool.terminate()
+            thread_pool.join()
+
+    def _run_async_queries(self, ctx: TopologyContext, queries: List[Query]) -> List[Tuple[Query, QueryResults]]:
+        # Query expressions are evaluated in declaration order, then all returned awaitables run on one event loop.
+        self.log.info(f"Running {len(queries)} queries from {self.etl.source} on the event loop.")
+        results = self.event_loop.resolve_all([self._get_query_result(ctx, query_spec) for query_spec in queries])
+        return [
+            (query_spec, self._to_query_results(query_spec, result)) for query_spec, result in zip(queries, results)
+        ]
+
+    def _await_query_result(self, query_spec: Query, result: Any) -> QueryResults:
+        if not is_async(result):
+            return result
+        return self._to_query_results(query_spec, self.event_loop.resolve_all([result])[0])
+
+    @staticmethod
+    def _to_query_results(query_spec: Query, result: Any) -> QueryResults:
+        if isinstance(result, Exception):
+            raise Exception(f"Failed to run query '{query_spec.name}'. Message: {str(result)} ")
+        return QueryInterpreter.to_results(query_spec, result)
+
+    def _dispatch_by_template(
+        self,
+        ctx: TopologyContext,
+        query_spec: Query,
+        query_results: List[Dict[str, Any]],
+        interpreters: List[BaseTemplateInterpreter],
+        selector_index: SelectorIndex,
+        query_post_processor: QueryProcessorInterpreter,
+    ) -> int:
+        processed_by_counter = 0
+        # Field selectors are resolved for all items before the first template runs.
+        routed: Dict[int, List[Dict[str, Any]]] = {position: [] for position in selector_index.indexed}
+        if routed:
+            for item in query_results:
+                for position in selector_index.route(ctx.factory, item):
+                    routed[position].append(item)
+        for position, interpreter in enumerate(interpreters):
+            if position in routed:
+                for item in routed[position]:
+                    processed_by_counter += self._interpret_item(interpreter, item, selected=True)
+            else:
                 for item in query_results:
-                    if interpreter.active(item):
-                        try:
-                            interpreter.interpret(item)
-                            processed_by_counter += 1
-                        except Exception as e:
-                            self.log.error(json.dumps(item, indent=4))
-                            raise e
+                    processed_by_counter += self._interpret_item(interpreter, item)
+        if query_spec.processor is not None:
             for item in query_results:
                 ctx.item = item
                 query_post_processor.interpret(query_spec)
-            if processed_by_counter == 0:
-                self.log.warning(f"Unprocessed Count for Query {query_spec.name} is 0")
+        return processed_by_counter
 
-        self.log.info(f"Query Template Processing Counters:\n{counters}")
+    def _dispatch_by_item(
+        self,
+        ctx: TopologyContext,
+        query_spec: Query,
+        query_results: Iterable[Dict[str, Any]],
+        interpreters: List[BaseTemplateInterpreter],
+        selector_index: SelectorIndex,
+        query_post_processor: QueryProcessorInterpreter,
+    ) -> int:
+        processed_by_counter = 0
+        indexed = selector_index.indexed
+        for item in query_results:
+            selected = selector_index.route(ctx.factory, item) if indexed else indexed
+            for position, interpreter in enumerate(interpreters):
+                if position not in indexed:
+                    processed_by_counter += self._interpret_item(interpreter, item)
+                elif position in selected:
+                    processed_by_counter += self._interpret_item(interpreter, item, selected=True)
+            if query_spec.processor is not None:
+                ctx.item = item
+                query_post_processor.interpret(query_spec)
+        return processed_by_counter
+
+    def _interpret_item(self, interpreter: BaseTemplateInterpreter, item: Dict[str, Any], selected=False) -> int:
+        if not selected and not interpreter.active(item):
+            return 0
+        try:
+            interpreter.interpret(item)
+        except Exception as e:
+            self.log.error(json.dumps(item, indent=4))
+            raise e
+        return 1
 
-    def _get_interpreter(self, ctx, template_ref):
-        template = self.template_lookup.component.get(template_ref, None)
-        if template:
-            return ComponentTemplateInterpreter(ctx, template, self.conf.domain, self.conf.layer, self.conf.environment)
-        template = self.template_lookup.processor.get(template_ref, None)
-        if template:
-            return ProcessorTemplateInterpreter(ctx, template, self.conf.domain, self.conf.layer, self.conf.environment)
-        template = self.template_lookup.event.get(template_ref, None)
-        if template:
-            return EventTemplateInterpreter(ctx, template, self.conf.domain, self.conf.layer, self.conf.environment)
-        template = self.template_lookup.metric.get(template_ref, None)
-        if template:
-            return MetricTemplateInterpreter(ctx, template, self.conf.domain, self.conf.layer, self.conf.environment)
-        template = self.template_lookup.health.get(template_ref, None)
-        if template:
-            return HeathTemplateInterpreter(ctx, template, self.conf.domain, self.conf.layer, self.conf.environment)
+    def _get_interpreter(self, ctx, template_ref, pool: Optional[InterpreterPool]):
+        interpreters: Dict[str, Type[BaseTemplateInterpreter]] = {
+            "component": ComponentTemplateInterpreter,
+            "processor": ProcessorTemplateInterpreter,
+            "event": EventTemplateInterpreter,
+            "metric": MetricTemplateInterpreter,
+            "health": HeathTemplateInterpreter,
+        }
+        for attr_name in TemplateLookup.TEMPLATE_TYPES:
+            interpreter_class = interpreters[attr_name]
+            template = getattr(self.template_lookup, attr_name).get(template_ref, None)
+            if template:
+                return interpreter_class(
+                    ctx,
+                    template,
+                    self.conf.domain,
+                    self.conf.layer,
+                    self.conf.environment,
+                    pool=pool,
+                    compiled=self.template_lookup.get_compiled(attr_name, template_ref),
+                )
         raise Exception(f"Template '{template_ref}' not found.")
 
     def _process_post_processors(self, ctx: TopologyContext):
         for processor_spec in self.etl.post_processors:
-            ProcessorInterpreter(ctx).interpret(processor_spec)
+            self._run_processor(ctx, processor_spec)
 
     def _process_pre_processors(self, ctx: TopologyContext):
         for processor_spec in self.etl.pre_processors:
-            ProcessorInterpreter(ctx).interpret(processor_spec)
+            self._run_processor(ctx, processor_spec)
+
+    def _run_processor(self, ctx: TopologyContext, processor_spec: ProcessorSpec):
+        interpreter = ProcessorInterpreter(ctx, self.pool)
+        try:
+            interpreter.interpret(processor_spec)
+        finally:
+            interpreter.release()
 
     def _init_datasources(self, ctx: TopologyContext):
-        interpreter = DataSourceInterpreter(ctx)
-        for ds in self.etl.datasources:
-            if ds.name not in ctx.datasources:
-                interpreter.interpret(ds, self.conf)
+        interpreter = DataSourceInterpreter(ctx, self.pool)
+        try:
+            for ds in self.etl.datasources:
+                if ds.name not in ctx.datasources:
+                    interpreter.interpret(ds, self.conf)
+        finally:
+            interpreter.release()
+        # Async `init` expressions, e.g. ones that log in with an async client, are awaited together.
+        pending = [ds.name for ds in self.etl.datasources if is_async(ctx.datasources.get(ds.name, None))]
+        if pending:
+            instances = self.event_loop.resolve_all([ctx.datasources[name] for name in pending])
+            for name, instance in zip(pending, instances):
+                if isinstance(instance, Exception):
+                    raise Exception(f"Failed to initialize datasource '{name}'. Message: {str(instance)} ")
+                if instance is None:
+                    raise Exception(f"Value returns from init for datasource  '{name} cannot be None.")
+                ctx.datasources[name] = instance
 
-    @staticmethod
-    def _get_query_result(ctx: TopologyContext, query: Query) -> List[Dict[str, Any]]:
-        interpreter = QueryInterpreter(ctx)
-        return interpreter.interpret(query)
+    def _get_query_result(self, ctx: TopologyContext, query: Query) -> QueryResults:
+        interpreter = QueryInterpreter(ctx, self.pool)
+        try:
+            return interpreter.interpret(query)
+        finally:
+            interpreter.release()
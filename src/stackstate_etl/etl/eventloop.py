@@ -0,0 +1,90 @@
+import inspect
+from typing import Any, List, Optional
+
+try:
+    import asyncio
+except ImportError:  # Python 2.7
+    asyncio = None  # type: ignore
+
+
+def is_awaitable(value: Any) -> bool:
+    return asyncio is not None and inspect.isawaitable(value)
+
+
+def is_async_iterator(value: Any) -> bool:
+    return callable(getattr(value, "__anext__", None))
+
+
+def is_async(value: Any) -> bool:
+    return is_awaitable(value) or is_async_iterator(value)
+
+
+class EventLoopRunner:
+    """
+    Owns the event loop on which async datasources and query expressions run. The loop lives as long as the runner,
+    so async clients created by a datasource `init` stay bound to the loop that later awaits their queries.
+    """
+
+    def __init__(self):
+        self.loop: Optional[Any] = None
+
+    def resolve_all(self, values: List[Any]) -> List[Any]:
+        """
+        Awaits all awaitables and drains all async iterators in `values` concurrently. Other values are returned
+        as-is. Like `asyncio.gather(..., return_exceptions=True)`, a failure is returned in place of its result.
+        """
+        results = list(values)
+        pending = [position for position, value in enumerate(results) if is_async(value)]
+        while pending:
+            loop = self._get_loop()
+            futures = [self._to_future(loop, results[position]) for position in pending]
+            resolved = loop.run_until_complete(asyncio.gather(*futures, return_exceptions=True))
+            for position, result in zip(pending, resolved):
+                results[position] = result
+            # An awaitable may resolve to an async iterator, which is drained in the next round.
+            pending = [position for position in pending if is_async(results[position])]
+        return results
+
+    def close(self):
+        if self.loop is not None:
+            try:
+                self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            finally:
+                self.loop.close()
+                self.loop = None
+
+    def _get_loop(self) -> Any:
+        if asyncio is None:
+            raise Exception("Async datasources and queries require asyncio.")
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop
+
+    def _to_future(self, loop: Any, value: Any) -> Any:
+        if is_async_iterator(value):
+            return self._collect(loop, value)
+        return asyncio.ensure_future(value, loop=loop)
+
+    @staticmethod
+    def _collect(loop: Any, iterator: Any) -> Any:
+        # Drives `__anext__` through future callbacks, so no coroutine syntax is needed for Python 2.7.
+        collected = loop.create_future()
+        items: List[Any] = []
+
+        def step(previous: Optional[Any] = None):
+            if previous is not None:
+                if previous.cancelled():
+                    collected.cancel()
+                    return
+                error = previous.exception()
+                if isinstance(error, StopAsyncIteration):
+                    collected.set_result(items)
+                    return
+                if error is not None:
+                    collected.set_exception(error)
+                    return
+                items.append(previous.result())
+            asyncio.ensure_future(iterator.__anext__(), loop=loop).add_done_callback(step)
+
+        step()
+        return collected
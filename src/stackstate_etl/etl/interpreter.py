@@ -1,41 +1,38 @@
+import ast
 import datetime
 import importlib
 import re
-from typing import Any, Dict, List, Optional, Union
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 import attr
-import pytz
-import requests
-from asteval import Interpreter
+from asteval import Interpreter, make_symbol_table
+from asteval.asteval import Procedure
+from cachetools import LRUCache
 from jsonpath_ng.exceptions import JsonPathLexerError, JsonPathParserError
-from six import string_types
+from schematics import Model
+from schematics.exceptions import DataError
+from schematics.types import ListType, UnionType
+from six import add_metaclass, string_types
 
 try:
-    import networkx
+    from collections import abc
 except ImportError:
-    networkx = None
-try:
-    import pandas
-except ImportError:
-    pandas = None
-try:
-    import pendulum
-except ImportError:
-    pendulum = None
-try:
-    import pydash
-    from pydash import py_
-except ImportError:
-    pydash = None
-    py_ = None
+    import collections as abc  # type: ignore
 
 
+from stackstate_etl.etl.eventloop import is_async
+from stackstate_etl.etl.lazy import LazyImport
+from stackstate_etl.etl.paging import is_paged, iterate_pages, paged
 from stackstate_etl.model.etl import (
     ComponentTemplate,
     ComponentTemplateSpec,
     DataSource,
     EventTemplate,
     EventTemplateSpec,
+    FieldSelector,
     HealthTemplate,
     HealthTemplateSpec,
     MetricTemplate,
@@ -50,12 +47,212 @@ from stackstate_etl.model.stackstate import (
     EVENT_CATEGORY_CHOICES,
     HEALTH_STATE_CHOICES,
     METRIC_TYPE_CHOICES,
-    Component,
     Event,
     HealthCheckState,
     Metric,
     SourceLink,
 )
+from stackstate_etl.model.topology import TopologyComponent
+
+# Heavy and optional libraries are only imported when template code first uses them.
+LAZY_LIBRARIES = {
+    "py_": LazyImport("pydash", "py_"),
+    "pydash": LazyImport("pydash"),
+    "pytz": LazyImport("pytz"),
+    "pendulum": LazyImport("pendulum"),
+    "networkx": LazyImport("networkx"),
+    "requests": LazyImport("requests"),
+    "pandas": LazyImport("pandas"),
+}
+
+
+def library_symbols() -> Dict[str, Any]:
+    symbols: Dict[str, Any] = {"datetime": datetime, "re": re, "paged": paged}
+    symbols.update(LAZY_LIBRARIES)
+    return symbols
+
+
+class ExpressionCache:
+    """
+    Process wide, bounded cache of parsed asteval ASTs keyed on the expression text.
+
+    Template expressions are evaluated per item, but the source text is the same for every item. Parsing once and
+    only executing the AST per item removes the repeated `ast.parse` cost from the hot path.
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.cache: LRUCache = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, expression: str) -> Optional[ast.AST]:
+        with self.lock:
+            node = self.cache.get(expression, None)
+            if node is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return node
+
+    def put(self, expression: str, node: ast.AST):
+        with self.lock:
+            self.cache[expression] = node
+
+    def reset_lock(self):
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.cache), "maxsize": self.cache.maxsize}
+
+
+expression_cache = ExpressionCache()
+
+
+class PooledInterpreter(Interpreter):
+    def __init__(self, symtable: Dict[str, Any]):
+        Interpreter.__init__(self, symtable=symtable)
+        self.base_symtable = dict(self.symtable)
+
+    def defines_procedures(self) -> bool:
+        base = self.base_symtable
+        return any(isinstance(v, Procedure) and base.get(k) is not v for k, v in self.symtable.items())
+
+    def reset(self):
+        self.symtable.clear()
+        self.symtable.update(self.base_symtable)
+        self.error = []
+        self.error_msg = None
+        self.retval = None
+        self.expr = None
+        self.code_text = []
+        self._interrupt = None
+        self._calldepth = 0
+
+
+class InterpreterPool:
+    """
+    Hands out asteval interpreters that share a symbol table built once per driver.
+
+    Released interpreters are reset to their base symbol table, so no symbols leak between templates.
+    Interpreters whose code defined functions are not reused, as those functions keep a reference to the
+    interpreter and can still be called via the session or a datasource.
+    """
+
+    def __init__(self):
+        self.base_symtable = make_symbol_table()
+        self.base_symtable.update(library_symbols())
+        self.available: List[PooledInterpreter] = []
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> PooledInterpreter:
+        with self.lock:
+            if self.available:
+                return self.available.pop()
+            self.created += 1
+        return PooledInterpreter(dict(self.base_symtable))
+
+    def release(self, aeval: PooledInterpreter):
+        if aeval.defines_procedures():
+            return
+        aeval.reset()
+        with self.lock:
+            self.available.append(aeval)
+
+
+QueryResults = Union[List[Dict[str, Any]], Iterator[Dict[str, Any]]]
+
+CONSTANT = "constant"
+JSONPATH = "jsonpath"
+CODE = "code"
+
+
+class CompiledExpression:
+    """
+    A template expression classified once as a constant, a jsonpath or code, so evaluating it per item no longer
+    needs to inspect the expression text.
+    """
+
+    __slots__ = ("kind", "expression", "code")
+
+    def __init__(self, expression: Any, force_eval: bool = False):
+        self.expression = expression
+        self.code = ""
+        if isinstance(expression, string_types) and expression.startswith("$."):
+            self.kind = JSONPATH
+        elif isinstance(expression, string_types) and (expression.startswith("|") or force_eval or "\n" in expression):
+            self.kind = CODE
+            code = expression.strip()
+            self.code = code[1:] if code.startswith("|") else code
+        else:
+            self.kind = CONSTANT
+
+
+class CompiledSpec:
+    """Mirror of a template spec model where every expression field is a `CompiledExpression`."""
+
+    RAW_FIELDS = ["processor", "mergeable"]
+
+    def __init__(self, spec: Model):
+        for field_name, field in spec._fields.items():
+            setattr(self, field_name, self._compile_field(field_name, field, getattr(spec, field_name)))
+
+    def _compile_field(self, field_name: str, field: Any, value: Any) -> Any:
+        if value is None or field_name in self.RAW_FIELDS:
+            return value
+        if isinstance(field, ListType) and isinstance(value, list):
+            return [CompiledSpec(v) if isinstance(v, Model) else CompiledExpression(v) for v in value]
+        if isinstance(field, UnionType):
+            # Union fields are either a list/dict of expressions or a single expression returning a list/dict.
+            if isinstance(value, list):
+                return [CompiledExpression(v) for v in value]
+            elif isinstance(value, dict):
+                return {k: CompiledExpression(v) for k, v in value.items()}
+            return CompiledExpression(value, force_eval=True)
+        return CompiledExpression(value)
+
+
+class CompiledFieldSelector:
+    """Declarative selector that matches when the value at `field` is one of `values`."""
+
+    def __init__(self, template_name: str, selector: Dict[str, Any]):
+        field_selector = FieldSelector(selector)
+        try:
+            field_selector.validate()
+            self.values = frozenset(field_selector.values)
+        except (DataError, TypeError) as e:
+            raise Exception(f"Invalid field selector on template '{template_name}'. Message: {str(e)}")
+        field = field_selector.field
+        self.field = field if field.startswith("$") else f"$.{field}"
+
+    def matches(self, factory: TopologyFactory, item: Any) -> bool:
+        try:
+            return factory.jpath(self.field, item) in self.values
+        except TypeError:
+            # Unhashable values, like lists and dicts, never match.
+            return False
+
+
+class CompiledTemplate:
+    def __init__(
+        self, template: Union[ComponentTemplate, ProcessorTemplate, EventTemplate, MetricTemplate, HealthTemplate]
+    ):
+        self.name = template.name
+        self.selector: Optional[CompiledExpression] = None
+        self.field_selector: Optional[CompiledFieldSelector] = None
+        if isinstance(template.selector, dict):
+            self.field_selector = CompiledFieldSelector(template.name, template.selector)
+        elif template.selector is not None:
+            self.selector = CompiledExpression(template.selector)
+        spec = getattr(template, "spec", None)
+        self.spec: Any = None if spec is None else CompiledSpec(spec)
 
 
 @attr.s(kw_only=True)
@@ -63,7 +260,7 @@ class TopologyContext:
     factory: TopologyFactory = attr.ib()
     item: Dict[str, Any] = attr.ib(default=None)
     datasources: Dict[str, Any] = attr.ib(default={})
-    component: Component = attr.ib(default=None)
+    component: TopologyComponent = attr.ib(default=None)
     event: Event = attr.ib(default=None)
     metric: Metric = attr.ib(default=None)
     health: HealthCheckState = attr.ib(default=None)
@@ -75,12 +272,18 @@ class TopologyContext:
 
 
 class BaseInterpreter:
-    def __init__(self, ctx: TopologyContext):
+    def __init__(self, ctx: TopologyContext, pool: Optional[InterpreterPool] = None):
         self.ctx = ctx
-        self.aeval = Interpreter()
+        self.pool = pool
+        self.aeval = Interpreter() if pool is None else pool.acquire()
         self.source_name = "default"
         self._init_static_symtable()
 
+    def release(self):
+        if self.pool is not None and self.aeval is not None:
+            self.pool.release(self.aeval)
+            self.aeval = None
+
     def _init_static_symtable(self):
         symtable = self.aeval.symtable
         ctx = self.ctx
@@ -89,15 +292,8 @@ class BaseInterpreter:
         symtable["session"] = ctx.session
         symtable["global_session"] = ctx.global_session
         symtable["uid"] = ctx.factory.get_uid
-        symtable["py_"] = py_
-        symtable["pydash"] = pydash
-        symtable["datetime"] = datetime
-        symtable["pytz"] = pytz
-        symtable["pendulum"] = pendulum
-        symtable["networkx"] = networkx
-        symtable["re"] = re
-        symtable["requests"] = requests
-        symtable["pandas"] = pandas
+        if self.pool is None:
+            symtable.update(library_symbols())
         symtable["log"] = ctx.factory.log
 
     def _run_code(self, code: str, property_name) -> Any:
@@ -111,9 +307,8 @@ class BaseInterpreter:
         return value
 
     def _eval_expression(self, expression: str, eval_property: str, fail_on_error: bool = True) -> Any:
-        existing_errs = len(self.aeval.error)
-        result = self.aeval.eval(expression)
-        if len(self.aeval.error) > existing_errs and fail_on_error:
+        result = self._execute(expression)
+        if len(self.aeval.error) > 0 and fail_on_error:
             error_messages = []
             for err in self.aeval.error:
                 lineno = 0 if not err.node else err.node.lineno
@@ -137,6 +332,23 @@ class BaseInterpreter:
             raise Exception("\n".join(error_lines))
         return result
 
+    def _execute(self, expression: str) -> Any:
+        aeval = self.aeval
+        aeval.error = []
+        aeval.error_msg = None
+        aeval.start_time = time.time()
+        node = expression_cache.get(expression)
+        try:
+            if node is None:
+                node = aeval.parse(expression)
+                expression_cache.put(expression, node)
+            return aeval.run(node, expr=expression, lineno=0, with_raise=False)
+        except Exception:
+            if len(aeval.error) == 0:
+                raise
+            # asteval records the failure in `aeval.error`, which is reported by the caller.
+            return None
+
     def _get_eval_expression_failed_source(self) -> str:
         return self.source_name
 
@@ -154,8 +366,8 @@ class BaseInterpreter:
 
 
 class DataSourceInterpreter(BaseInterpreter):
-    def __init__(self, ctx: TopologyContext):
-        BaseInterpreter.__init__(self, ctx)
+    def __init__(self, ctx: TopologyContext, pool: Optional[InterpreterPool] = None):
+        BaseInterpreter.__init__(self, ctx, pool)
 
     def interpret(self, datasource: DataSource, instance_info: InstanceInfo) -> object:
         self.source_name = f"datasource '{datasource.name}'"
@@ -195,23 +407,34 @@ class DataSourceInterpreter(BaseInterpreter):
 
 
 class QueryInterpreter(BaseInterpreter):
-    def __init__(self, ctx: TopologyContext):
-        BaseInterpreter.__init__(self, ctx)
+    def __init__(self, ctx: TopologyContext, pool: Optional[InterpreterPool] = None):
+        BaseInterpreter.__init__(self, ctx, pool)
 
-    def interpret(self, query: Query) -> List[Dict[str, Any]]:
+    def interpret(self, query: Query) -> QueryResults:
         self.source_name = f"query '{query.name}'"
         self._update_asteval_symtable()
         items = self._run_code(query.query, "query")
+        if is_async(items):
+            # Awaitables and async iterators are resolved by the driver on its event loop.
+            return items
+        return self.to_results(query, items)
+
+    @staticmethod
+    def to_results(query: Query, items: Any) -> QueryResults:
         if items is None:
             items = []
-        if not isinstance(items, list):
+        if is_paged(items):
+            # Parallel queries fork worker processes, which must not happen while a prefetch thread is running.
+            items = iterate_pages(items, query.name, query.prefetch and not query.parallel)
+        if not isinstance(items, (list, abc.Iterator)):
             items = [items]
+        # Iterators, like generators over paginated APIs, are streamed and not materialised.
         return items
 
 
 class QueryProcessorInterpreter(BaseInterpreter):
-    def __init__(self, ctx: TopologyContext):
-        BaseInterpreter.__init__(self, ctx)
+    def __init__(self, ctx: TopologyContext, pool: Optional[InterpreterPool] = None):
+        BaseInterpreter.__init__(self, ctx, pool)
 
     def interpret(self, query: Query):
         self.source_name = f"query '{query.name}'"
@@ -220,8 +443,8 @@ class QueryProcessorInterpreter(BaseInterpreter):
 
 
 class ProcessorInterpreter(BaseInterpreter):
-    def __init__(self, ctx: TopologyContext):
-        BaseInterpreter.__init__(self, ctx)
+    def __init__(self, ctx: TopologyContext, pool: Optional[InterpreterPool] = None):
+        BaseInterpreter.__init__(self, ctx, pool)
 
     def interpret(self, processor: ProcessorSpec):
         self.source_name = f"processor '{processor.name}'"
@@ -229,6 +452,7 @@ class ProcessorInterpreter(BaseInterpreter):
         self._run_code(processor.code, "code")
 
 
+@add_metaclass(ABCMeta)
 class BaseTemplateInterpreter(BaseInterpreter):
     def __init__(
         self,
@@ -237,26 +461,35 @@ class BaseTemplateInterpreter(BaseInterpreter):
         domain: str,
         layer: str,
         environment: str,
+        pool: Optional[InterpreterPool] = None,
+        compiled: Optional[CompiledTemplate] = None,
     ):
-        BaseInterpreter.__init__(self, ctx)
+        BaseInterpreter.__init__(self, ctx, pool)
         self.environment = environment
         self.layer = layer
         self.domain = domain
         self.template_name = template.name
         self.template = template
+        self.compiled = CompiledTemplate(template) if compiled is None else compiled
         self.source_name = self.template_name
 
+    @abstractmethod
+    def interpret(self, item: Dict[str, Any]) -> Any:
+        pass
+
     def active(self, item: Any) -> bool:
-        template = self.template
+        compiled = self.compiled
         self.ctx.item = item
-        if template.selector is None:
+        if compiled.field_selector is not None:
+            return compiled.field_selector.matches(self.ctx.factory, item)
+        if compiled.selector is None:
             return True
-        return self._get_value(template.selector, "selector")
+        return self._get_value(compiled.selector, "selector")
 
     def _merge_list_property(self, value: Union[Optional[str], List[str]], name: str) -> List[str]:
         if value is None:
             return []
-        elif isinstance(value, string_types):
+        elif isinstance(value, (CompiledExpression, string_types)):
             return self._get_list_property(value, name)
         else:
             return [self._get_string_property(v, name) for v in value]
@@ -272,7 +505,7 @@ class BaseTemplateInterpreter(BaseInterpreter):
     def _get_list_property(self, expression: Union[str, list], name: str, default=None) -> List[Any]:
         if default is None:
             default = []
-        if isinstance(expression, string_types):
+        if isinstance(expression, (CompiledExpression, string_types)):
             values = self._get_value(expression, name, default=default, force_eval=True)
         else:
             values = expression
@@ -282,7 +515,7 @@ class BaseTemplateInterpreter(BaseInterpreter):
     def _get_dict_property(self, expression: Union[str, Dict[str, Any]], name: str, default=None) -> Dict[str, Any]:
         if default is None:
             default = {}
-        if isinstance(expression, string_types):
+        if isinstance(expression, (CompiledExpression, string_types)):
             values = self._get_value(expression, name, default=default, force_eval=True)
         else:
             values = expression
@@ -292,24 +525,30 @@ class BaseTemplateInterpreter(BaseInterpreter):
             result[k] = self._get_value(v, f"{name}:{k}")
         return result
 
-    def _get_value(self, expression: str, name: str, default: Any = None, force_eval=False) -> Any:
+    def _get_value(
+        self, expression: Union[CompiledExpression, Any], name: str, default: Any = None, force_eval=False
+    ) -> Any:
         if expression is None:
             return default
-        if isinstance(expression, string_types) and expression.startswith("$."):
+        if not isinstance(expression, CompiledExpression):
+            expression = CompiledExpression(expression, force_eval)
+        kind = expression.kind
+        if kind is CONSTANT:
+            return expression.expression
+        elif kind is JSONPATH:
             try:
-                return self.ctx.factory.jpath(expression, self.ctx.item, default)
+                return self.ctx.factory.jpath(expression.expression, self.ctx.item, default)
             except (JsonPathParserError, JsonPathLexerError) as e:
                 raise Exception(
                     f"Failed to evaluate property '{name}' for '{self.source_name}' on template `{self.template_name}`."
-                    f" Expression |\n {expression} \n |.\n Errors:\n {str(e)}"
+                    f" Expression |\n {expression.expression} \n |.\n Errors:\n {str(e)}"
                 )
-        elif isinstance(expression, string_types) and (expression.startswith("|") or force_eval or "\n" in expression):
-            result = self._run_code(expression, name)
+        else:
+            self._update_asteval_symtable()
+            result = self._eval_expression(expression.code, name)
             if result is None:
                 return default
             return result
-        else:
-            return expression
 
     def _assert_string(self, value: Any, name: str) -> str:
         if value is not None:
@@ -351,25 +590,34 @@ class BaseTemplateInterpreter(BaseInterpreter):
 
 
 class ComponentTemplateInterpreter(BaseTemplateInterpreter):
-    def __init__(self, ctx: TopologyContext, template: ComponentTemplate, domain: str, layer: str, environment: str):
-        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment)
+    def __init__(
+        self,
+        ctx: TopologyContext,
+        template: ComponentTemplate,
+        domain: str,
+        layer: str,
+        environment: str,
+        pool: Optional[InterpreterPool] = None,
+        compiled: Optional[CompiledTemplate] = None,
+    ):
+        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment, pool, compiled)
 
-    def interpret(self, item: Dict[str, Any]) -> Component:
+    def interpret(self, item: Dict[str, Any]) -> TopologyComponent:
         template = self.template
         self.ctx.item = item
-        self.ctx.component = Component()
+        self.ctx.component = TopologyComponent()
         self._update_asteval_symtable()
         if template.spec and template.code:
             raise Exception(f"Template {template.name} cannot have both spec and code properties.")
         if template.spec:
-            return self._interpret_spec(template.spec)
+            return self._interpret_spec(self.compiled.spec)
         elif template.code:
             return self._interpret_code(template.code)
         else:
             raise Exception(f"Template {template.name} must have either spec and code properties defined.")
 
-    def _interpret_spec(self, spec: ComponentTemplateSpec) -> Component:
-        component: Component = self.ctx.component
+    def _interpret_spec(self, spec: ComponentTemplateSpec) -> TopologyComponent:
+        component: TopologyComponent = self.ctx.component
         ctype = self._get_string_property(spec.component_type, "type")
         if ctype:
             component.set_type(ctype)
@@ -398,7 +646,7 @@ class ComponentTemplateInterpreter(BaseTemplateInterpreter):
         self.ctx.factory.add_component(component)
         return component
 
-    def _interpret_code(self, code: str) -> Component:
+    def _interpret_code(self, code: str) -> TopologyComponent:
         component = self.ctx.component
         self._run_code(code, "code")
         if component.get_name() is None:
@@ -417,8 +665,17 @@ class ComponentTemplateInterpreter(BaseTemplateInterpreter):
 
 
 class ProcessorTemplateInterpreter(BaseTemplateInterpreter):
-    def __init__(self, ctx: TopologyContext, template: ProcessorTemplate, domain: str, layer: str, environment: str):
-        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment)
+    def __init__(
+        self,
+        ctx: TopologyContext,
+        template: ProcessorTemplate,
+        domain: str,
+        layer: str,
+        environment: str,
+        pool: Optional[InterpreterPool] = None,
+        compiled: Optional[CompiledTemplate] = None,
+    ):
+        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment, pool, compiled)
 
     def interpret(self, item: Dict[str, Any]):
         template = self.template
@@ -428,8 +685,19 @@ class ProcessorTemplateInterpreter(BaseTemplateInterpreter):
 
 
 class MetricTemplateInterpreter(BaseTemplateInterpreter):
-    def __init__(self, ctx: TopologyContext, template: MetricTemplate, domain: str, layer: str, environment: str):
-        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment)
+    def __init__(
+        self,
+        ctx: TopologyContext,
+        template: MetricTemplate,
+        domain: str,
+        layer: str,
+        environment: str,
+        pool: Optional[InterpreterPool] = None,
+        compiled: Optional[CompiledTemplate] = None,
+    ):
+        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment, pool, compiled)
+        # Spec expressions read the point being built as `metric`; one model is reused instead of one per point.
+        self.metric = Metric()
 
     def interpret(self, item: Dict[str, Any]) -> Optional[Metric]:
         template: MetricTemplate = self.template
@@ -438,14 +706,18 @@ class MetricTemplateInterpreter(BaseTemplateInterpreter):
         if template.spec and template.code:
             raise Exception(f"Template {template.name} cannot have both spec and code properties.")
         if template.spec:
-            return self._interpret_spec(template.spec, template)
+            return self._interpret_spec(self.compiled.spec, template)
         elif template.code:
             return self._interpret_code(template.code)
         else:
             raise Exception(f"Template {template.name} must have either spec and code properties defined.")
 
     def _interpret_spec(self, spec: MetricTemplateSpec, template: MetricTemplate):
-        self.ctx.metric = metric = Metric()
+        self.ctx.metric = metric = self.metric
+        # Fields read before they are set hold what a new `Metric` would, not the values of the previous point.
+        metric.name = metric.target_uid = metric.value = None  # type: ignore
+        metric.metric_type = "gauge"
+        metric.tags = []
         self._update_asteval_symtable()
         metric.name = self._get_string_property(spec.name, "name", None)
         if metric.name is None:
@@ -459,8 +731,11 @@ class MetricTemplateInterpreter(BaseTemplateInterpreter):
             )
         metric.metric_type = metric_type
         metric.value = self._get_float_property(spec.value, "value")
+        if metric.value is None:
+            raise Exception(f"Template {template.name} metric value is required.")
         metric.tags = self._get_list_property(spec.tags, "tags", [])
-        self.ctx.factory.add_metric(metric)
+        # The point goes into the factory metric buffer, the model is only the context of the expressions.
+        self.ctx.factory.add_metric_value(metric.name, metric.value, metric_type, metric.tags, metric.target_uid)
 
     def _interpret_code(self, code: str):
         self._update_asteval_symtable()
@@ -468,15 +743,24 @@ class MetricTemplateInterpreter(BaseTemplateInterpreter):
 
 
 class EventTemplateInterpreter(BaseTemplateInterpreter):
-    def __init__(self, ctx: TopologyContext, template: EventTemplate, domain: str, layer: str, environment: str):
-        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment)
+    def __init__(
+        self,
+        ctx: TopologyContext,
+        template: EventTemplate,
+        domain: str,
+        layer: str,
+        environment: str,
+        pool: Optional[InterpreterPool] = None,
+        compiled: Optional[CompiledTemplate] = None,
+    ):
+        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment, pool, compiled)
 
     def interpret(self, item: Dict[str, Any]) -> Event:
         template: EventTemplate = self.template
         self.ctx.item = item
         self.ctx.event = event = Event()
         self._update_asteval_symtable()
-        spec: EventTemplateSpec = template.spec
+        spec: EventTemplateSpec = self.compiled.spec
 
         event.event_type = self._get_string_property(spec.event_type, "event_type", None)
         if event.event_type is None:
@@ -511,15 +795,24 @@ class EventTemplateInterpreter(BaseTemplateInterpreter):
 
 
 class HeathTemplateInterpreter(BaseTemplateInterpreter):
-    def __init__(self, ctx: TopologyContext, template: HealthTemplate, domain: str, layer: str, environment: str):
-        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment)
+    def __init__(
+        self,
+        ctx: TopologyContext,
+        template: HealthTemplate,
+        domain: str,
+        layer: str,
+        environment: str,
+        pool: Optional[InterpreterPool] = None,
+        compiled: Optional[CompiledTemplate] = None,
+    ):
+        BaseTemplateInterpreter.__init__(self, ctx, template, domain, layer, environment, pool, compiled)
 
     def interpret(self, item: Dict[str, Any]) -> HealthCheckState:
         template: HealthTemplate = self.template
         self.ctx.item = item
         self.ctx.health = health = HealthCheckState()
         self._update_asteval_symtable()
-        spec: HealthTemplateSpec = template.spec
+        spec: HealthTemplateSpec = self.compiled.spec
 
         health.check_id = self._get_string_property(spec.check_id, "check_id", None)
         if health.check_id is None:
@@ -0,0 +1,57 @@
+import importlib
+import threading
+from typing import Any, Optional
+
+_UNRESOLVED = object()
+
+
+class LazyImport:
+    """
+    Stand-in for a module, or an attribute of a module, that is only imported when template code first uses it.
+    Attribute access and calls are forwarded to the imported object. An optional library that is not installed is
+    falsy, like the `None` that used to take its place, and raises an `ImportError` when used.
+    """
+
+    __slots__ = ("_module_name", "_attribute", "_target", "_lock")
+
+    def __init__(self, module_name: str, attribute: Optional[str] = None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target: Any = _UNRESOLVED
+        self._lock = threading.Lock()
+
+    def _resolve(self) -> Any:
+        target = self._target
+        if target is _UNRESOLVED:
+            with self._lock:
+                if self._target is _UNRESOLVED:
+                    module = importlib.import_module(self._module_name)
+                    self._target = module if self._attribute is None else getattr(module, self._attribute)
+                target = self._target
+        return target
+
+    def reset_lock(self):
+        # A forked worker process may inherit the lock while another thread of the parent held it.
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        if name in LazyImport.__slots__:
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self._resolve()(*args, **kwargs)
+
+    def __bool__(self) -> bool:
+        try:
+            self._resolve()
+        except ImportError:
+            return False
+        return True
+
+    __nonzero__ = __bool__  # Python 2.7
+
+    def __repr__(self) -> str:
+        name = self._module_name if self._attribute is None else f"{self._module_name}.{self._attribute}"
+        state = "unresolved" if self._target is _UNRESOLVED else "resolved"
+        return f"<LazyImport {name} ({state})>"
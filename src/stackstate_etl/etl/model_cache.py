@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+import pickle
+from typing import Any, Dict, Optional
+
+import yaml
+
+from stackstate_etl.model import etl as etl_model
+
+# The libyaml C loader is several times faster than the pure Python loader, when PyYAML was built with it.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Bump when the cache entry format changes. Changes to the ETL model itself are picked up by `schema_hash`.
+MODEL_CACHE_VERSION = 1
+
+_schema_hash: Optional[str] = None
+
+
+def schema_hash() -> str:
+    """
+    Hash of the module that defines the ETL model and its validation, so entries cached by another version of the
+    package, e.g. before an upgrade, are not used.
+    """
+    global _schema_hash
+    if _schema_hash is None:
+        _schema_hash = _content_hash(etl_model.__file__)  # type: ignore
+    return _schema_hash
+
+
+def load_yaml(stream: Any) -> Any:
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+class ModelCache:
+    """
+    Persistent cache of validated ETL models, stored as their native (dict) representation. An entry is keyed by the
+    absolute path of the yaml file and is only used when it was stored with the same ETL model schema and the file's
+    mtime and size are unchanged, or its content hash still matches.
+
+    Entries are unpickled, and unpickling runs code, so the cache directory must be a trusted location that only the
+    agent user can write to.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.log = logging.getLogger()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, yaml_file: str) -> Optional[Dict[str, Any]]:
+        entry = self._read_entry(yaml_file)
+        if entry is not None:
+            stat = os.stat(yaml_file)
+            if (entry["mtime"], entry["size"]) == (stat.st_mtime, stat.st_size) or entry["hash"] == _content_hash(
+                yaml_file
+            ):
+                self.hits += 1
+                return entry["model"]
+        self.misses += 1
+        return None
+
+    def store(self, yaml_file: str, model: Dict[str, Any]):
+        stat = os.stat(yaml_file)
+        entry = {
+            "version": MODEL_CACHE_VERSION,
+            "schema": schema_hash(),
+            "path": os.path.abspath(yaml_file),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": _content_hash(yaml_file),
+            "model": model,
+        }
+        entry_file = self._entry_file(yaml_file)
+        tmp_file = f"{entry_file}.{os.getpid()}.tmp"
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(tmp_file, "wb") as f:
+                pickle.dump(entry, f, protocol=2)
+            # Atomic, so concurrent processes never read a partially written entry.
+            getattr(os, "replace", os.rename)(tmp_file, entry_file)
+        except (IOError, OSError) as e:
+            self.log.warning(f"Failed to write model cache entry for {yaml_file}. Message: {str(e)}")
+
+    def _read_entry(self, yaml_file: str) -> Optional[Dict[str, Any]]:
+        entry_file = self._entry_file(yaml_file)
+        if not os.path.isfile(entry_file):
+            return None
+        try:
+            with open(entry_file, "rb") as f:
+                entry = pickle.load(f)
+        except Exception as e:
+            self.log.warning(f"Ignoring unreadable model cache entry {entry_file}. Message: {str(e)}")
+            return None
+        if (
+            not isinstance(entry, dict)
+            or entry.get("version", None) != MODEL_CACHE_VERSION
+            or entry.get("schema", None) != schema_hash()
+            or entry.get("path", None) != os.path.abspath(yaml_file)
+        ):
+            return None
+        return entry
+
+    def _entry_file(self, yaml_file: str) -> str:
+        key = hashlib.sha256(os.path.abspath(yaml_file).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.pickle")
+
+
+def _content_hash(yaml_file: str) -> str:
+    with open(yaml_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
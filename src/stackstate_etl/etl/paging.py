@@ -0,0 +1,65 @@
+from multiprocessing.pool import ThreadPool
+from typing import Any, Callable, Generator, List, Optional, Tuple
+
+PageResult = Tuple[List[Any], Optional[Any]]
+
+
+class PagedQuery:
+    """
+    Paging protocol for datasources. A query expression that returns an object with a `fetch_page(token)` method is
+    paged by the driver: `fetch_page` is called with `None` for the first page and must return a tuple of the page
+    items and the continuation token for the next page, or `None` when there are no more pages.
+
+    This class adapts a plain function to the protocol, e.g. `paged(client.get_hosts_page)` in a query expression.
+    """
+
+    def __init__(self, fetch: Callable[[Optional[Any]], PageResult]):
+        self.fetch = fetch
+
+    def fetch_page(self, token: Optional[Any]) -> PageResult:
+        return self.fetch(token)
+
+
+def paged(fetch: Callable[[Optional[Any]], PageResult]) -> PagedQuery:
+    return PagedQuery(fetch)
+
+
+def is_paged(result: Any) -> bool:
+    return callable(getattr(result, "fetch_page", None))
+
+
+def iterate_pages(source: Any, name: str, prefetch: bool = True) -> Generator[Any, None, None]:
+    """
+    Yields the items of all pages of `source`. With `prefetch`, page N+1 is fetched on a background thread while
+    the items of page N are consumed, so at most two pages are held in memory.
+    """
+    if not prefetch:
+        token = None
+        while True:
+            items, token = _check_page(source.fetch_page(token), name)
+            for item in items:
+                yield item
+            if token is None:
+                return
+    thread_pool = ThreadPool(processes=1)
+    try:
+        pending: Optional[Any] = thread_pool.apply_async(source.fetch_page, (None,))
+        while pending is not None:
+            items, token = _check_page(pending.get(), name)
+            pending = None if token is None else thread_pool.apply_async(source.fetch_page, (token,))
+            for item in items:
+                yield item
+    finally:
+        thread_pool.terminate()
+        thread_pool.join()
+
+
+def _check_page(page: Any, name: str) -> PageResult:
+    if not isinstance(page, tuple) or len(page) != 2:
+        raise Exception(f"Paged query '{name}' must return a tuple of (items, next_token), but was {type(page)}.")
+    items, token = page
+    if items is None:
+        items = []
+    if not isinstance(items, list):
+        raise Exception(f"Paged query '{name}' must return a list of items per page, but was {type(items)}.")
+    return items, token
@@ -0,0 +1,85 @@
+import logging
+import multiprocessing
+import os
+from typing import Any, Callable, List, Optional, Tuple
+
+from stackstate_etl.etl.interpreter import LAZY_LIBRARIES, expression_cache
+from stackstate_etl.model.factory import TopologyFactory
+
+ShardInterpreter = Callable[[TopologyFactory, List[Any]], int]
+
+
+class ShardJob:
+    def __init__(self, shards: List[List[Any]], interpret_shard: ShardInterpreter, factory: TopologyFactory):
+        self.shards = shards
+        self.interpret_shard = interpret_shard
+        self.factory_mode = factory.mode
+        self.validation = factory.validation
+        self.validation_sample_rate = factory.validation_sample_rate
+        self.events = factory.events.empty()
+
+
+# Worker processes are forked, so they inherit the job, datasources and sessions without pickling them.
+_job: Optional[ShardJob] = None
+
+
+def can_fork() -> bool:
+    return hasattr(os, "fork")
+
+
+def partition(items: List[Any], shard_count: int) -> List[List[Any]]:
+    shard_count = max(1, min(shard_count, len(items)))
+    size, remainder = divmod(len(items), shard_count)
+    shards = []
+    start = 0
+    for i in range(shard_count):
+        end = start + size + (1 if i < remainder else 0)
+        shards.append(items[start:end])
+        start = end
+    return shards
+
+
+def interpret_in_processes(
+    factory: TopologyFactory, items: List[Any], workers: int, interpret_shard: ShardInterpreter
+) -> int:
+    """
+    Partitions `items` into contiguous shards that are interpreted by forked worker processes, each into its own
+    `TopologyFactory`. Worker factories are merged back into `factory` in shard order, using the same conflict
+    handling as `TopologyFactory.add_component`.
+    """
+    global _job
+    shards = partition(items, workers)
+    if len(shards) <= 1 or not can_fork():
+        return interpret_shard(factory, items)
+    _job = ShardJob(shards, interpret_shard, factory)
+    get_context = getattr(multiprocessing, "get_context", None)
+    context: Any = multiprocessing if get_context is None else get_context("fork")
+    pool = context.Pool(processes=len(shards))
+    try:
+        results: List[Tuple[TopologyFactory, int]] = pool.map(_interpret_shard, range(len(shards)))
+    finally:
+        pool.terminate()
+        pool.join()
+        _job = None
+    processed = 0
+    for shard_factory, shard_processed in results:
+        factory.merge(shard_factory)
+        processed += shard_processed
+    return processed
+
+
+def _interpret_shard(index: int) -> Tuple[TopologyFactory, int]:
+    job = _job
+    if job is None:
+        raise Exception("No shard job available in worker process.")
+    # The expression cache and lazy import locks may have been held by another thread when the worker was forked.
+    expression_cache.reset_lock()
+    for library in LAZY_LIBRARIES.values():
+        library.reset_lock()
+    factory = TopologyFactory(
+        mode=job.factory_mode, validation=job.validation, validation_sample_rate=job.validation_sample_rate
+    )
+    factory.log = logging.getLogger()
+    factory.events = job.events
+    processed = job.interpret_shard(factory, job.shards[index])
+    return factory, processed
@@ -10,7 +10,11 @@ from schematics.types import (
     UnionType,
 )
 
-from stackstate_etl.model.stackstate import EVENT_CATEGORY_CHOICES, AnyType
+from stackstate_etl.model.stackstate import (
+    EVENT_CATEGORY_CHOICES,
+    METRIC_TYPE_CHOICES,
+    AnyType,
+)
 
 
 class DataSource(Model):
@@ -20,11 +24,29 @@ class DataSource(Model):
     init: str = StringType(required=True)
 
 
+TEMPLATE_DISPATCH = "template"
+ITEM_DISPATCH = "item"
+DISPATCH_CHOICES = [TEMPLATE_DISPATCH, ITEM_DISPATCH]
+
+
 class Query(Model):
     name: str = StringType(required=True)
     query: str = StringType(required=True)
     processor: str = StringType(required=False)
     template_refs: List[str] = ListType(StringType(), required=True, default=[])
+    # 'template' runs each template over all items, 'item' runs all templates on an item in a single pass.
+    dispatch: str = StringType(default=TEMPLATE_DISPATCH, choices=DISPATCH_CHOICES)
+    # Templates only use the current item, so results may be sharded across `InstanceInfo.template_workers`.
+    # Shards run in forked processes: writes to `session` and `global_session` made by their templates are lost.
+    # Parallel queries are never prefetched and cannot be combined with `InstanceInfo.query_concurrency` above 1.
+    parallel: bool = BooleanType(default=False)
+    # Fetch the next page of a paged query on a background thread while the current page is interpreted.
+    prefetch: bool = BooleanType(default=True)
+
+
+class FieldSelector(Model):
+    field: str = StringType(required=True)
+    values: List[Any] = ListType(AnyType(), required=True)
 
 
 class ComponentTemplateSpec(Model):
@@ -44,14 +66,14 @@ class ComponentTemplateSpec(Model):
 
 class ComponentTemplate(Model):
     name: str = StringType(required=True)
-    selector: str = StringType(default=None)
+    selector: Union[str, Dict[str, Any]] = UnionType((StringType, DictType(AnyType)), default=None)
     spec = ModelType(ComponentTemplateSpec)
     code = StringType()
 
 
 class ProcessorTemplate(Model):
     name: str = StringType(required=True)
-    selector: str = StringType(default=None)
+    selector: Union[str, Dict[str, Any]] = UnionType((StringType, DictType(AnyType)), default=None)
     code = StringType(required=True)
 
 
@@ -74,7 +96,7 @@ class EventTemplateSpec(Model):
 
 class EventTemplate(Model):
     name: str = StringType(required=True)
-    selector: str = StringType(default=None)
+    selector: Union[str, Dict[str, Any]] = UnionType((StringType, DictType(AnyType)), default=None)
     spec = ModelType(EventTemplateSpec)
 
 
@@ -88,7 +110,7 @@ class HealthTemplateSpec(Model):
 
 class HealthTemplate(Model):
     name: str = StringType(required=True)
-    selector: str = StringType(default=None)
+    selector: Union[str, Dict[str, Any]] = UnionType((StringType, DictType(AnyType)), default=None)
     spec = ModelType(HealthTemplateSpec)
 
 
@@ -102,7 +124,7 @@ class MetricTemplateSpec(Model):
 
 class MetricTemplate(Model):
     name: str = StringType(required=True)
-    selector: str = StringType(default=None)
+    selector: Union[str, Dict[str, Any]] = UnionType((StringType, DictType(AnyType)), default=None)
     spec = ModelType(MetricTemplateSpec)
     code = StringType()
 
@@ -112,6 +134,17 @@ class ProcessorSpec(Model):
     code = StringType()
 
 
+ROLLUP_FUNCTIONS = ["last", "avg", "max", "min", "sum", "histogram"]
+
+
+class MetricRollup(Model):
+    # Metric name, or a shell-style pattern like `storage.*`. The first matching rollup applies to a series.
+    metric: str = StringType(required=True)
+    metric_type: str = StringType(choices=METRIC_TYPE_CHOICES)
+    # Defaults to the usual aggregation of the metric type, e.g. `last` for gauges and `sum` for counts.
+    function: str = StringType(choices=ROLLUP_FUNCTIONS)
+
+
 class Template(Model):
     components: List[ComponentTemplate] = ListType(ModelType(ComponentTemplate), default=[])
     processors: List[ProcessorTemplate] = ListType(ModelType(ProcessorTemplate), default=[])
@@ -128,3 +161,4 @@ class ETL(Model):
     datasources: List[DataSource] = ListType(ModelType(DataSource), default=[])
     queries: List[Query] = ListType(ModelType(Query), default=[])
     template: Template = ModelType(Template)
+    metric_rollups: List[MetricRollup] = ListType(ModelType(MetricRollup), default=[])
@@ -0,0 +1,119 @@
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from stackstate_etl.model.stackstate import Event
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+DROP_POLICIES = [DROP_NEWEST, DROP_OLDEST]
+
+# Event fields that are read from the event context.
+CONTEXT_FIELDS = frozenset(["category", "data", "element_identifiers", "source", "source_links"])
+# Event fields a dedup key may name.
+DEDUP_FIELDS = sorted([field for field in Event.fields if field != "context"] + list(CONTEXT_FIELDS))
+
+
+def _key_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_key_value(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+class EventBuffer:
+    """
+    Events of a cycle, in the order they were added. Events with the same `dedup_key` fields as a kept event are
+    dropped when they are added within `dedup_window` seconds of it, or at any time in the cycle when the window is 0.
+    At most `max_size` events are held; when full, `drop_policy` drops the new event or evicts the oldest one.
+    """
+
+    def __init__(
+        self,
+        dedup_key: Optional[List[str]] = None,
+        dedup_window: float = 0,
+        max_size: Optional[int] = None,
+        drop_policy: str = DROP_NEWEST,
+    ):
+        unknown = [field for field in dedup_key or [] if field not in DEDUP_FIELDS]
+        if unknown:
+            raise Exception(f"Event dedup key fields {unknown} not allowed. Valid values {DEDUP_FIELDS}.")
+        self.dedup_key = dedup_key or []
+        self.dedup_window = dedup_window
+        self.max_size = max_size
+        self.drop_policy = drop_policy
+        self.events: Deque[Tuple[Any, Event]] = deque()
+        self.kept: Dict[Any, Tuple[float, Event]] = {}
+        self.deduplicated = 0
+        self.dropped = 0
+
+    def empty(self) -> "EventBuffer":
+        """A new buffer with the same settings."""
+        return EventBuffer(self.dedup_key, self.dedup_window, self.max_size, self.drop_policy)
+
+    def key_of(self, event: Event) -> Any:
+        if not self.dedup_key:
+            return None
+        return tuple(
+            _key_value(getattr(event.context if field in CONTEXT_FIELDS else event, field)) for field in self.dedup_key
+        )
+
+    def append(self, event: Event) -> bool:
+        """Adds `event` and returns whether it was kept."""
+        key = self.key_of(event)
+        added_at = event.timestamp.timestamp() if event.timestamp is not None else time.time()
+        if key is not None:
+            kept = self.kept.get(key, None)
+            if kept is not None and (not self.dedup_window or abs(added_at - kept[0]) < self.dedup_window):
+                self.deduplicated += 1
+                return False
+        if self.max_size is not None and len(self.events) >= self.max_size:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST or self.max_size == 0:
+                return False
+            evicted_key, evicted = self.events.popleft()
+            if evicted_key is not None and self.kept[evicted_key][1] is evicted:
+                del self.kept[evicted_key]
+        self.events.append((key, event))
+        if key is not None:
+            self.kept[key] = (added_at, event)
+        return True
+
+    def merge(self, other: "EventBuffer"):
+        for event in other:
+            self.append(event)
+        self.deduplicated += other.deduplicated
+        self.dropped += other.dropped
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __bool__(self) -> bool:
+        return len(self.events) > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self) -> Iterator[Event]:
+        for _, event in self.events:
+            yield event
+
+    def __getitem__(self, index: int) -> Event:
+        return self.events[index][1]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Schematics models cannot be pickled, so events travel as native dicts.
+        return {
+            "settings": (self.dedup_key, self.dedup_window, self.max_size, self.drop_policy),
+            "events": [event.to_native() for event in self],
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(*state["settings"])  # type: ignore
+        for event in state["events"]:
+            self.append(Event(event))
+        self.deduplicated = state["deduplicated"]
+        self.dropped = state["dropped"]
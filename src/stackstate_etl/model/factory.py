@@ -1,72 +1,458 @@
 import logging
-from typing import Any, Dict, List, Optional, Union
+import threading
+import zlib
+from bisect import bisect_left, insort
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from cachetools import LRUCache, keys
-from jsonpath_ng import parse
+from jsonpath_ng import Child, Fields, Index, Root, parse
+from schematics.exceptions import DataError
+from six import string_types
 
+from stackstate_etl.model.events import EventBuffer
+from stackstate_etl.model.metrics import MetricBuffer
 from stackstate_etl.model.stackstate import (
-    Component,
+    ComponentType,
     Event,
     HealthCheckState,
     Metric,
     Relation,
+    intern_string,
 )
+from stackstate_etl.model.stackstate_receiver import RelationResolutionStats
+from stackstate_etl.model.topology import TopologyComponent, TopologyRelation
 
 STRICT = "Strict"
 LENIENT = "Lenient"
 IGNORE = "Ignore"
 
+EAGER = "Eager"
+DEFERRED = "Deferred"
+SAMPLED = "Sampled"
+SAMPLE_BUCKETS = 10000
+
+# A relation waiting for its target: (owner uid, source id, target id, relation type).
+PendingRelation = Tuple[str, str, str, str]
+
+
+class SimpleJsonPath:
+    """
+    Resolves jsonpath expressions made up only of fields and non-negative indices, like `$.status.hypervisor.ip`,
+    with direct dict/list access. Values of any other type are resolved by jsonpath_ng, so results stay identical.
+    """
+
+    __slots__ = ("expression", "steps")
+
+    def __init__(self, expression: Any, steps: List[Union[str, int]]):
+        self.expression = expression
+        self.steps = steps
+
+    @staticmethod
+    def from_expression(expression: Any) -> Optional["SimpleJsonPath"]:
+        steps: List[Union[str, int]] = []
+        node = expression
+        while isinstance(node, Child):
+            right = node.right
+            if isinstance(right, Fields) and len(right.fields) == 1 and right.fields[0] not in ("*", "auto_id"):
+                steps.append(right.fields[0])
+            elif isinstance(right, Index):
+                # jsonpath_ng < 1.6 keeps a single `index`, later versions a tuple of `indices`.
+                indices = getattr(right, "indices", None) or (getattr(right, "index"),)
+                if len(indices) != 1 or indices[0] < 0:
+                    return None
+                steps.append(indices[0])
+            else:
+                return None
+            node = node.left
+        if not isinstance(node, Root):
+            return None
+        steps.reverse()
+        return SimpleJsonPath(expression, steps)
+
+    def find_value(self, target: Any, default: Any = None) -> Any:
+        current = target
+        for step in self.steps:
+            if isinstance(step, int):
+                if isinstance(current, list):
+                    if step >= len(current):
+                        return default
+                    current = current[step]
+                    continue
+            elif isinstance(current, dict):
+                if step not in current:
+                    return default
+                current = current[step]
+                continue
+            if current is None:
+                return default
+            return find_values(self.expression, target, default)
+        return current
+
+
+def find_values(jsonpath_expr: Any, target: Any, default: Any = None) -> Union[Optional[Any], List[Any]]:
+    matches = jsonpath_expr.find(target)
+    if not matches:
+        return default
+    if len(matches) == 1:
+        return matches[0].value
+    return [m.value for m in matches]
+
+
+class ComponentIndex:
+    """
+    Secondary indexes over the components of a factory: name -> uids, (type, name) -> uids, identifier -> uids and a
+    sorted list of reversed names for postfix search. That list is built by the first postfix search, so bulk loading
+    does not keep it sorted, and is kept sorted from then on.
+    Matches are returned in the order of `TopologyFactory.components`, so lookups give the same results as a scan.
+    Components report changes to their type, name and identifiers; `refresh` picks up identifiers appended directly
+    to the identifiers list.
+    """
+
+    def __init__(self, components: Dict[str, TopologyComponent]):
+        self.components = components
+        self.keys: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.positions: Dict[str, int] = {}
+        self.by_name: Dict[Optional[str], Dict[str, None]] = {}
+        self.by_type_and_name: Dict[Tuple[Optional[str], Optional[str]], Dict[str, None]] = {}
+        self.reversed_names: Optional[List[Tuple[str, str]]] = None
+        self.identifier_keys: Dict[str, FrozenSet[str]] = {}
+        self.by_identifier: Dict[str, Dict[str, None]] = {}
+
+    def update(self, component: TopologyComponent):
+        uid = component.uid
+        if self.components.get(uid, None) is not component:
+            # A component that was replaced by a merge no longer belongs to the index.
+            return
+        self._update_names(uid, component)
+        self._update_identifiers(uid, component)
+
+    def refresh(self):
+        for component in self.components.values():
+            self.update(component)
+
+    def _update_names(self, uid: str, component: TopologyComponent):
+        name = component.get_name()
+        component_type = component.component_type.name if component.component_type is not None else None
+        key = (name, component_type)
+        existing_key = self.keys.get(uid, None)
+        if existing_key == key:
+            return
+        if existing_key is not None:
+            self._remove(uid, existing_key)
+            if existing_key[0] != name:
+                self._remove_reversed_name(uid, existing_key[0])
+                self._add_reversed_name(uid, name)
+        else:
+            self.positions[uid] = len(self.positions)
+            self._add_reversed_name(uid, name)
+        self.keys[uid] = key
+        self.by_name.setdefault(name, {})[uid] = None
+        self.by_type_and_name.setdefault((component_type, name), {})[uid] = None
+
+    def _add_reversed_name(self, uid: str, name: Optional[str]):
+        if self.reversed_names is not None and isinstance(name, string_types):
+            insort(self.reversed_names, (name[::-1], uid))
+
+    def _remove_reversed_name(self, uid: str, name: Optional[str]):
+        if self.reversed_names is not None and isinstance(name, string_types):
+            entry = (name[::-1], uid)
+            position = bisect_left(self.reversed_names, entry)
+            if position < len(self.reversed_names) and self.reversed_names[position] == entry:
+                del self.reversed_names[position]
+
+    def _update_identifiers(self, uid: str, component: TopologyComponent):
+        identifiers = frozenset(component.properties.identifiers or [])
+        existing = self.identifier_keys.get(uid, frozenset())
+        if identifiers == existing:
+            return
+        for identifier in existing - identifiers:
+            self._discard(self.by_identifier, identifier, uid)
+        for identifier in identifiers - existing:
+            self.by_identifier.setdefault(identifier, {})[uid] = None
+        self.identifier_keys[uid] = identifiers
+
+    def find_by_identifier(self, identifier: str) -> List[TopologyComponent]:
+        return self._components(self.by_identifier.get(identifier, {}))
+
+    def find_by_name(self, name: str) -> List[TopologyComponent]:
+        return self._components(self.by_name.get(name, {}))
+
+    def find_by_type_and_name(self, component_type: str, name: str) -> List[TopologyComponent]:
+        return self._components(self.by_type_and_name.get((component_type, name), {}))
+
+    def find_by_name_postfix(self, postfix: str) -> List[TopologyComponent]:
+        reversed_names = self.reversed_names
+        if reversed_names is None:
+            reversed_names = self.reversed_names = sorted(
+                (name[::-1], uid) for uid, (name, _) in self.keys.items() if isinstance(name, string_types)
+            )
+        reversed_postfix = postfix[::-1]
+        uids = []
+        position = bisect_left(reversed_names, (reversed_postfix, ""))
+        while position < len(reversed_names):
+            reversed_name, uid = reversed_names[position]
+            if not reversed_name.startswith(reversed_postfix):
+                break
+            uids.append(uid)
+            position += 1
+        return self._components(uids)
+
+    def _remove(self, uid: str, key: Tuple[Optional[str], Optional[str]]):
+        name, component_type = key
+        self._discard(self.by_name, name, uid)
+        self._discard(self.by_type_and_name, (component_type, name), uid)
+
+    @staticmethod
+    def _discard(index: Dict[Any, Dict[str, None]], key: Any, uid: str):
+        uids = index.get(key, None)
+        if uids is not None:
+            uids.pop(uid, None)
+            if not uids:
+                del index[key]
+
+    def _components(self, uids: Any) -> List[TopologyComponent]:
+        if len(uids) > 1:
+            uids = sorted(uids, key=self.positions.__getitem__)
+        return [self.components[uid] for uid in uids if uid in self.components]
+
+
+try:
+    from collections import abc
+except ImportError:
+    import collections as abc  # type: ignore
+
+RELATION_SEPARATOR = " --> "
+
+
+class RelationStore(abc.Mapping):
+    """
+    Compact store of the factory relations. An edge is kept as a tuple of interned source and target ids with a
+    relation type code; the `Relation` model is only materialised when it is read, typically at publish time, and is
+    kept from then on so changes made to it are not lost. Reads like the `Dict[str, Relation]` keyed by
+    `"{source_id} --> {target_id}"` that it replaces.
+    """
+
+    def __init__(self):
+        self.edges: Dict[Tuple[str, str], int] = {}
+        self.type_names: List[str] = []
+        self.type_codes: Dict[str, int] = {}
+        self.materialized: Dict[Tuple[str, str], Relation] = {}
+
+    @staticmethod
+    def relation_id(source_id: str, target_id: str) -> str:
+        return f"{source_id}{RELATION_SEPARATOR}{target_id}"
+
+    def add(self, source_id: str, target_id: str, rel_type: str) -> bool:
+        key = (intern_string(source_id), intern_string(target_id))
+        if key in self.edges:
+            return False
+        code = self.type_codes.get(rel_type, None)
+        if code is None:
+            code = len(self.type_names)
+            self.type_names.append(rel_type)
+            self.type_codes[rel_type] = code
+        self.edges[key] = code
+        return True
+
+    def put(self, relation: Relation) -> bool:
+        if not self.add(relation.source_id, relation.target_id, relation.get_type()):
+            return False
+        self.materialized[(relation.source_id, relation.target_id)] = relation
+        return True
+
+    def has(self, source_id: str, target_id: str) -> bool:
+        return (source_id, target_id) in self.edges
+
+    def get_relation(self, source_id: str, target_id: str) -> Relation:
+        key = (source_id, target_id)
+        relation = self.materialized.get(key, None)
+        if relation is None:
+            rel_type = self.type_names[self.edges[key]]
+            relation = Relation(
+                {"source_id": source_id, "target_id": target_id, "external_id": self.relation_id(source_id, target_id)}
+            )
+            relation.set_type(rel_type)
+            self.materialized[key] = relation
+        return relation
+
+    def type_of(self, source_id: str, target_id: str) -> str:
+        return self.type_names[self.edges[(source_id, target_id)]]
+
+    def __getitem__(self, rel_id: str) -> Relation:
+        source_id, _, target_id = rel_id.partition(RELATION_SEPARATOR)
+        return self.get_relation(source_id, target_id)
+
+    def __contains__(self, rel_id: Any) -> bool:
+        if not isinstance(rel_id, string_types):
+            return False
+        source_id, _, target_id = rel_id.partition(RELATION_SEPARATOR)
+        return (source_id, target_id) in self.edges
+
+    def __iter__(self) -> Iterator[str]:
+        for source_id, target_id in self.edges:
+            yield self.relation_id(source_id, target_id)
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def values(self) -> List[Relation]:  # type: ignore
+        return [self.get_relation(source_id, target_id) for source_id, target_id in self.edges]
+
+    def items(self) -> List[Tuple[str, Relation]]:  # type: ignore
+        return [(relation.external_id, relation) for relation in self.values()]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Relations that were never read travel as plain edges, read ones as native dicts.
+        return {
+            "edges": [
+                (s, t, self.type_names[c]) for (s, t), c in self.edges.items() if (s, t) not in self.materialized
+            ],
+            "materialized": [r.to_native() for r in self.materialized.values()],
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__()  # type: ignore
+        for source_id, target_id, rel_type in state["edges"]:
+            self.add(source_id, target_id, rel_type)
+        for relation in state["materialized"]:
+            self.put(Relation(relation))
+
 
 class TopologyFactory:
-    def __init__(self, mode=STRICT):
+    def __init__(self, mode=STRICT, incremental_relations=False, validation=EAGER, validation_sample_rate=0.1):
         self.mode = mode
-        self.components: Dict[str, Component] = {}
-        self.relations: Dict[str, Relation] = {}
+        self.incremental_relations = incremental_relations
+        self.validation = validation
+        self.validation_sample_rate = validation_sample_rate
+        self.components: Dict[str, TopologyComponent] = {}
+        self.component_index = ComponentIndex(self.components)
+        self.relations = RelationStore()
         self.health: Dict[str, HealthCheckState] = {}
-        self.events: List[Event] = []
-        self.metrics: List[Metric] = []
+        self.events = EventBuffer()
+        self.metrics = MetricBuffer()
         self.lookups: Dict[str, Any] = {}
+        self.relation_stats = RelationResolutionStats()
+        self.pending_relations: Dict[str, List[PendingRelation]] = {}
         self.log = logging.getLogger()
         self.jpath_cache = LRUCache(maxsize=500)
+        self.jpath_lock = threading.Lock()
 
     def jpath(self, path: str, target: Any, default: Any = None) -> Union[Optional[Any], List[Any]]:
         jsonpath_expr = self._get_jsonpath_expr(path)
-        matches = jsonpath_expr.find(target)
-        if not matches:
-            return default
-        if len(matches) == 1:
-            return matches[0].value
-        return [m.value for m in matches]
+        if isinstance(jsonpath_expr, SimpleJsonPath):
+            return jsonpath_expr.find_value(target, default)
+        return find_values(jsonpath_expr, target, default)
 
     def _get_jsonpath_expr(self, path):
         key = keys.hashkey(path)
-        expression = self.jpath_cache.get(key, None)
+        with self.jpath_lock:
+            expression = self.jpath_cache.get(key, None)
         if expression is None:
             expression = parse(path)
-            self.jpath_cache[key] = expression
+            expression = SimpleJsonPath.from_expression(expression) or expression
+            with self.jpath_lock:
+                self.jpath_cache[key] = expression
         return expression
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Schematics models cannot be pickled, so the factory content travels as native dicts.
+        return {
+            "mode": self.mode,
+            "components": [c.to_native() for c in self.components.values()],
+            "relations": self.relations.__getstate__(),
+            "health": [h.to_native() for h in self.health.values()],
+            "events": self.events.__getstate__(),
+            "metrics": self.metrics.__getstate__(),
+            "incremental_relations": self.incremental_relations,
+            "validation": self.validation,
+            "validation_sample_rate": self.validation_sample_rate,
+            "pending_relations": self.pending_relations,
+            "relation_stats": self.relation_stats.to_native(),
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(state["mode"])  # type: ignore
+        for component in state["components"]:
+            self._store_component(TopologyComponent.from_native(component))
+        self.relations.__setstate__(state["relations"])
+        for health in state["health"]:
+            health = HealthCheckState(health)
+            self.health[health.check_id] = health
+        self.events.__setstate__(state["events"])
+        self.metrics.__setstate__(state["metrics"])
+        self.incremental_relations = state["incremental_relations"]
+        self.validation = state["validation"]
+        self.validation_sample_rate = state["validation_sample_rate"]
+        self.pending_relations = state["pending_relations"]
+        self.relation_stats = RelationResolutionStats(state["relation_stats"])
+
+    def merge(self, other: "TopologyFactory"):
+        for component in other.components.values():
+            self.add_component(component)
+        for source_id, target_id in other.relations.edges:
+            relation = other.relations.materialized.get((source_id, target_id), None)
+            if relation is not None:
+                if not self.relations.put(relation):
+                    self._handle_error(f"Relation '{relation.external_id}' already exists.")
+            else:
+                self._link(source_id, target_id, other.relations.type_of(source_id, target_id))
+        for health in other.health.values():
+            self.add_health(health)
+        self.events.merge(other.events)
+        self.metrics.merge(other.metrics)
+        for field in ("resolved_by_uid", "resolved_by_name", "resolved_by_identifier", "unresolved"):
+            setattr(
+                self.relation_stats, field, getattr(self.relation_stats, field) + getattr(other.relation_stats, field)
+            )
+        for reference, pending in other.pending_relations.items():
+            for pending_relation in pending:
+                self._resolve_by_uid_or_wait(reference, pending_relation)
+
     def add_event(self, event: Event):
         self.events.append(event)
 
     def add_metric(self, metric: Metric):
-        self.metrics.append(metric)
+        self.metrics.append_metric(metric)
 
     def add_metric_value(
         self, name: str, value: float, metric_type: str = "gauge", tags: List[str] = None, target_uid=None
     ):
-        metric = Metric()
-        metric.name = name
-        metric.value = value
-        metric.metric_type = metric_type
-        metric.target_uid = target_uid
-        if tags:
-            metric.tags = tags
-        self.metrics.append(metric)
-
-    def add_component(self, component: Component):
+        self.metrics.append(name, value, metric_type, tags, target_uid)
+
+    def add_metric_values(
+        self,
+        name: str,
+        values: Iterable[float],
+        metric_type: str = "gauge",
+        tags: Optional[List[str]] = None,
+        target_uid: Optional[str] = None,
+        timestamps: Optional[Iterable[float]] = None,
+    ):
+        """Adds many points of one metric series at once, e.g. a list of samples returned by a query."""
+        self.metrics.extend(name, values, metric_type, tags, target_uid, timestamps)
+
+    def add_component(self, component: TopologyComponent) -> TopologyComponent:
+        """
+        Stores `component` and returns the stored component. A `Component` model, e.g. built by processor code, is
+        stored as a `TopologyComponent` copy: changes made to the model after it was added are not seen by the
+        factory, so further changes have to be made on the returned component.
+        """
         if component is None:
             raise Exception("Component cannot be None.")
+        if not isinstance(component, TopologyComponent):
+            component = TopologyComponent.from_component(component)
+        # Every validation policy stores and indexes the component by the same string uid and name.
+        component.cast_keys()
         existing_component = self.components.get(component.uid, None)
         if existing_component is not None:
             if component.mergeable:
@@ -77,16 +463,75 @@ class TopologyFactory:
             else:
                 self._handle_error(f"Component '{component.uid}' already exists. No merge flags indicated.")
 
-        component.validate()
+        if self.validation == EAGER or (self.validation == SAMPLED and self._is_sampled(component)):
+            component.validate()
+        self._store_component(component)
+        return component
+
+    def _is_sampled(self, component: TopologyComponent) -> bool:
+        # Sampling by uid checks a merged component every time, or never, instead of at random.
+        if not isinstance(component.uid, string_types):
+            return True
+        bucket = zlib.crc32(component.uid.encode("utf-8")) % SAMPLE_BUCKETS
+        return bucket < self.validation_sample_rate * SAMPLE_BUCKETS
+
+    def validate_components(self) -> int:
+        """
+        Validates every component once, for the `Deferred` validation policy, and returns the number of components
+        validated. All failures are reported together in one `DataError`, keyed by component uid.
+        """
+        if self.validation != DEFERRED:
+            return 0
+        errors: Dict[str, Any] = {}
+        for uid, component in self.components.items():
+            try:
+                component.validate()
+            except DataError as e:
+                errors[uid] = e.errors
+        if errors:
+            raise DataError(errors)
+        return len(self.components)
+
+    def _store_component(self, component: TopologyComponent):
         self.components[component.uid] = component
+        component._index = self.component_index
+        self.component_index.update(component)
+        if self.incremental_relations:
+            self._resolve_incrementally(component)
 
-    def get_component(self, uid: str) -> Component:
+    def _resolve_incrementally(self, component: TopologyComponent):
+        """
+        Resolves the relations that wait for `component` and the relations of `component` whose other end already
+        exists. Only exact uid matches are resolved here; references that may match by name or identifier wait in
+        `pending_relations` until `resolve_relations`, so a later component cannot change the outcome.
+        """
+        for _, source_id, target_id, rel_type in self.pending_relations.pop(component.uid, []):
+            self._link(source_id, target_id, rel_type)
+            self.relation_stats.resolved_by_uid += 1
+        for relation in component.relations:
+            reverse = relation.target_id == component.uid
+            reference = relation.source_id if reverse else relation.target_id
+            pending_relation = (component.uid, relation.source_id, relation.target_id, relation.get_type())
+            self._resolve_by_uid_or_wait(reference, pending_relation)
+        # The relation models are no longer needed once they are resolved or waiting.
+        component.relations = []
+
+    def _resolve_by_uid_or_wait(self, reference: str, pending_relation: PendingRelation):
+        if reference in self.components:
+            self._link(pending_relation[1], pending_relation[2], pending_relation[3])
+            self.relation_stats.resolved_by_uid += 1
+        else:
+            self.pending_relations.setdefault(reference, []).append(pending_relation)
+
+    def get_component(self, uid: str) -> TopologyComponent:
         return self.components[uid]
 
     def get_component_by_name_and_type(
         self, component_type: str, name: str, raise_not_found: bool = True
-    ) -> Optional[Component]:
-        result = [c for c in self.components.values() if c.component_type == component_type and c.get_name() == name]
+    ) -> Optional[TopologyComponent]:
+        if isinstance(component_type, ComponentType):
+            component_type = component_type.name
+        result = self.component_index.find_by_type_and_name(component_type, name)
         if len(result) == 1:
             return result[0]
         elif len(result) == 0:
@@ -97,8 +542,8 @@ class TopologyFactory:
             msg = f"More than 1 result found for Component ({component_type}, {name}) search."
             return self._handle_multiple_results_error(msg, result)
 
-    def get_component_by_name(self, name: str, raise_not_found: bool = True) -> Optional[Component]:
-        result = [c for c in self.components.values() if c.get_name() == name]
+    def get_component_by_name(self, name: str, raise_not_found: bool = True) -> Optional[TopologyComponent]:
+        result = self.component_index.find_by_name(name)
         if len(result) == 1:
             return result[0]
         elif len(result) == 0:
@@ -109,8 +554,21 @@ class TopologyFactory:
             msg = f"More than 1 result found for Component {name} search."
             return self._handle_multiple_results_error(msg, result)
 
-    def get_component_by_name_postfix(self, postfix: str) -> Optional[Component]:
-        result = [c for c in self.components.values() if c.get_name().endswith(postfix)]
+    def get_component_by_identifier(self, identifier: str, raise_not_found: bool = True) -> Optional[TopologyComponent]:
+        result = self.component_index.find_by_identifier(identifier)
+        if len(result) == 1:
+            return result[0]
+        elif len(result) == 0:
+            if raise_not_found:
+                self._handle_error(f"Component with identifier {identifier} not found.")
+            return None
+        else:
+            uids = ", ".join(c.uid for c in result)
+            msg = f"More than 1 component claims identifier {identifier} ({uids})"
+            return self._handle_multiple_results_error(msg, result)
+
+    def get_component_by_name_postfix(self, postfix: str) -> Optional[TopologyComponent]:
+        result = self.component_index.find_by_name_postfix(postfix)
         if len(result) == 1:
             return result[0]
         elif len(result) == 0:
@@ -123,26 +581,23 @@ class TopologyFactory:
         return uid in self.components
 
     @staticmethod
-    def new_component() -> Component:
-        return Component()
+    def new_component() -> TopologyComponent:
+        return TopologyComponent()
 
     def get_relation(self, source_id: str, target_id: str) -> Relation:
-        rel_id = f"{source_id} --> {target_id}"
-        return self.relations[rel_id]
+        return self.relations.get_relation(source_id, target_id)
 
     def relation_exists(self, source_id: str, target_id: str) -> bool:
-        rel_id = f"{source_id} --> {target_id}"
-        return rel_id in self.relations
+        return self.relations.has(source_id, target_id)
 
     def add_relation(self, source_id: str, target_id: str, rel_type: str = "uses") -> Relation:
-        rel_id = f"{source_id} --> {target_id}"
-        if rel_id in self.relations:
-            self._handle_error(f"Relation '{rel_id}' already exists.")
-            return self.relations[rel_id]
-        relation = Relation({"source_id": source_id, "target_id": target_id, "external_id": rel_id})
-        relation.set_type(rel_type)
-        self.relations[rel_id] = relation
-        return relation
+        self._link(source_id, target_id, rel_type)
+        return self.relations.get_relation(source_id, target_id)
+
+    def _link(self, source_id: str, target_id: str, rel_type: str):
+        # Adds the edge without materialising a `Relation` model.
+        if not self.relations.add(source_id, target_id, rel_type):
+            self._handle_error(f"Relation '{RelationStore.relation_id(source_id, target_id)}' already exists.")
 
     def add_health(self, health: HealthCheckState):
         if health.check_id in self.health:
@@ -151,7 +606,7 @@ class TopologyFactory:
         self.health[health.check_id] = health
 
     @staticmethod
-    def add_component_relations(component: Component, relations: List[str]):
+    def add_component_relations(component: TopologyComponent, relations: List[str]):
         for relation in relations:
             rel_parts = relation.split("|")
             rel_type = "uses"
@@ -164,39 +619,78 @@ class TopologyFactory:
 
             if reverse:
                 rel_id = f"{rel_parts[0]} --> {component.uid}"
-                relation = Relation({"source_id": rel_parts[0], "target_id": component.uid, "external_id": rel_id})
+                component_relation = TopologyRelation(rel_parts[0], component.uid, rel_id, rel_type)
             else:
                 rel_id = f"{component.uid} --> {rel_parts[0]}"
-                relation = Relation({"source_id": component.uid, "target_id": rel_parts[0], "external_id": rel_id})
-            relation.set_type(rel_type)
-            component.relations.append(relation)
+                component_relation = TopologyRelation(component.uid, rel_parts[0], rel_id, rel_type)
+            component.relations.append(component_relation)
 
-    def resolve_relations(self):
-        components: List[Component] = self.components.values()
+    def resolve_relations(self) -> RelationResolutionStats:
+        """
+        Turns the relations held on components, and the relations waiting in `pending_relations`, into factory
+        relations. Each reference is matched by uid, otherwise by component name and otherwise by any of the component
+        identifiers. Every relation is resolved with dictionary lookups only, and name and identifier lookups are done
+        once per distinct reference.
+        """
+        # Identifiers may have been changed directly on the component properties since they were added.
+        self.component_index.refresh()
+        resolved_refs: Dict[str, Tuple[Optional[TopologyComponent], str]] = {}
+        components: List[TopologyComponent] = list(self.components.values())
         for source in components:
             for relation in source.relations:
-                resolve_id = relation.target_id
-                if source.uid == resolve_id:
-                    # There was a reverse relation '<' indicator
-                    resolve_id = relation.source_id
-                if self.component_exists(resolve_id):
-                    self.add_relation(relation.source_id, relation.target_id, relation.get_type())
-                else:
-                    target_component = self.get_component_by_name(resolve_id, raise_not_found=False)
-                    if target_component:
-                        self.add_relation(relation.source_id, target_component.uid, relation.get_type())
-                    else:
-                        msg = (
-                            f"Failed to find related component '{resolve_id}'. "
-                            f"Reference from component {source.uid}."
-                        )
-                        if self.mode == STRICT:
-                            self.log.error(msg)
-                            self.log.error("Current components known in factory:")
-                            for uid in self.components.keys():
-                                self.log.info(uid)
-                        self._handle_error(msg)
+                self._resolve_relation(
+                    (source.uid, relation.source_id, relation.target_id, relation.get_type()), resolved_refs
+                )
             source.relations = []
+        pending_relations = self.pending_relations
+        self.pending_relations = {}
+        for pending in pending_relations.values():
+            for pending_relation in pending:
+                self._resolve_relation(pending_relation, resolved_refs)
+        return self.relation_stats
+
+    def _resolve_relation(
+        self, pending_relation: PendingRelation, resolved_refs: Dict[str, Tuple[Optional[TopologyComponent], str]]
+    ):
+        stats = self.relation_stats
+        owner_uid, source_id, target_id, rel_type = pending_relation
+        resolve_id = target_id
+        reverse = owner_uid == resolve_id
+        if reverse:
+            # There was a reverse relation '<' indicator
+            resolve_id = source_id
+        if self.component_exists(resolve_id):
+            self._link(source_id, target_id, rel_type)
+            stats.resolved_by_uid += 1
+            return
+        if resolve_id not in resolved_refs:
+            resolved_refs[resolve_id] = self._find_related_component(resolve_id)
+        target_component, strategy = resolved_refs[resolve_id]
+        if target_component:
+            if reverse:
+                self._link(target_component.uid, target_id, rel_type)
+            else:
+                self._link(source_id, target_component.uid, rel_type)
+            if strategy == "name":
+                stats.resolved_by_name += 1
+            else:
+                stats.resolved_by_identifier += 1
+        else:
+            stats.unresolved += 1
+            msg = f"Failed to find related component '{resolve_id}'. Reference from component {owner_uid}."
+            if self.mode == STRICT:
+                self.log.error(msg)
+                self.log.error("Current components known in factory:")
+                for uid in self.components.keys():
+                    self.log.info(uid)
+            self._handle_error(msg)
+
+    def _find_related_component(self, reference: str) -> Tuple[Optional[TopologyComponent], str]:
+        component = self.get_component_by_name(reference, raise_not_found=False)
+        if component is not None:
+            return component, "name"
+        # When several components claim the identifier, the factory mode decides between failing and the first claim.
+        return self.get_component_by_identifier(reference, raise_not_found=False), "identifier"
 
     def _handle_error(self, msg):
         if self.mode == STRICT:
@@ -1,7 +1,18 @@
+from typing import List
+
 from schematics import Model
-from schematics.types import IntType, ModelType, StringType, URLType
+from schematics.types import (
+    BooleanType,
+    FloatType,
+    IntType,
+    ListType,
+    ModelType,
+    StringType,
+    URLType,
+)
 
 from stackstate_etl.model.etl import ETL
+from stackstate_etl.model.events import DEDUP_FIELDS
 
 
 class HealthSyncSpec(Model):
@@ -25,6 +36,19 @@ class InstanceInfo(Model):
     layer: str = StringType(default="ETL")
     environment: str = StringType(default="production")
     factory_mode: str = StringType(default="Strict", choices=["Strict", "Lenient", "Ignore"])
+    query_concurrency: int = IntType(default=1, min_value=1)
+    template_workers: int = IntType(default=1, min_value=1)
+    async_queries: bool = BooleanType(default=False)
+    # Cached models are loaded with pickle, so this must be a trusted directory that only the agent user can write to.
+    model_cache_dir: str = StringType(default=None)
+    incremental_relations: bool = BooleanType(default=False)
+    validation_policy: str = StringType(default="Eager", choices=["Eager", "Deferred", "Sampled"])
+    validation_sample_rate: float = FloatType(default=0.1, min_value=0, max_value=1)
+    # Event fields, e.g. ["event_type", "element_identifiers", "msg_title"], that make events duplicates of each other.
+    event_dedup_key: List[str] = ListType(StringType(choices=DEDUP_FIELDS), default=[])
+    event_dedup_window_seconds: float = FloatType(default=0, min_value=0)
+    max_events: int = IntType(default=None, min_value=0)
+    event_drop_policy: str = StringType(default="drop_newest", choices=["drop_newest", "drop_oldest"])
     etl: ETL = ModelType(ETL, required=True)
 
 
@@ -0,0 +1,244 @@
+import math
+import time
+from array import array
+from datetime import datetime
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pytz
+
+from stackstate_etl.model.etl import MetricRollup
+from stackstate_etl.model.stackstate import METRIC_TYPE_CHOICES, Metric, intern_string
+
+# A metric series: (name, target uid, metric type, tags).
+Series = Tuple[str, Optional[str], str, Tuple[str, ...]]
+
+METRIC_TYPES = frozenset(METRIC_TYPE_CHOICES)
+
+
+class MetricBuffer:
+    """
+    Columnar store for metric points. Every distinct (name, target uid, type, tags) series is kept once, and a point
+    only takes a series number, a value and a timestamp in typed arrays. Iterating the buffer gives `Metric` models,
+    `to_receiver` gives the receiver metrics format without building them.
+    """
+
+    def __init__(self):
+        self.series: List[Series] = []
+        self.series_ids: Dict[Series, int] = {}
+        self.points = array("l")
+        self.values = array("d")
+        self.timestamps = array("d")
+
+    def series_id(
+        self,
+        name: str,
+        metric_type: str = "gauge",
+        tags: Optional[Iterable[str]] = None,
+        target_uid: Optional[str] = None,
+    ) -> int:
+        if metric_type not in METRIC_TYPES:
+            raise Exception(f"Metric type '{metric_type}' not allowed. Valid values {METRIC_TYPE_CHOICES}.")
+        key = (name, target_uid, metric_type, tuple(tags) if tags else ())
+        series_id = self.series_ids.get(key, None)
+        if series_id is None:
+            series_id = len(self.series)
+            key = (
+                intern_string(name),
+                intern_string(target_uid),
+                intern_string(metric_type),
+                tuple(intern_string(tag) for tag in key[3]),
+            )
+            self.series.append(key)
+            self.series_ids[key] = series_id
+        return series_id
+
+    def append(
+        self,
+        name: str,
+        value: float,
+        metric_type: str = "gauge",
+        tags: Optional[Iterable[str]] = None,
+        target_uid: Optional[str] = None,
+        timestamp: Optional[float] = None,
+    ):
+        if value is None:
+            raise Exception(f"Metric '{name}' value is required.")
+        self.points.append(self.series_id(name, metric_type, tags, target_uid))
+        self.values.append(float(value))
+        self.timestamps.append(time.time() if timestamp is None else timestamp)
+
+    def extend(
+        self,
+        name: str,
+        values: Iterable[float],
+        metric_type: str = "gauge",
+        tags: Optional[Iterable[str]] = None,
+        target_uid: Optional[str] = None,
+        timestamps: Optional[Iterable[float]] = None,
+    ):
+        """Appends many points of one series, with the current time unless `timestamps` are given."""
+        values = list(values)
+        if None in values:
+            raise Exception(f"Metric '{name}' value is required.")
+        values = array("d", (float(value) for value in values))
+        if timestamps is None:
+            timestamps = array("d", [time.time()]) * len(values)
+        else:
+            timestamps = array("d", timestamps)
+            if len(timestamps) != len(values):
+                raise Exception(f"Metric '{name}' needs exactly one timestamp per value.")
+        series_id = self.series_id(name, metric_type, tags, target_uid)
+        self.points.extend(array("l", [series_id]) * len(values))
+        self.values.extend(values)
+        self.timestamps.extend(timestamps)
+
+    def append_metric(self, metric: Metric):
+        timestamp = metric.timestamp.timestamp() if metric.timestamp is not None else None
+        self.append(metric.name, metric.value, metric.metric_type, metric.tags, metric.target_uid, timestamp)
+
+    def merge(self, other: "MetricBuffer"):
+        mapping = array("l", (self.series_id(name, t, tags, uid) for name, uid, t, tags in other.series))
+        self.points.extend(mapping[series_id] for series_id in other.points)
+        self.values.extend(other.values)
+        self.timestamps.extend(other.timestamps)
+
+    def to_receiver(self) -> List[List[Any]]:
+        """Points in the receiver format `[name, timestamp in seconds, value, {hostname, tags, type}]`."""
+        details = [
+            (name, {"hostname": target_uid, "tags": list(tags), "type": metric_type})
+            for name, target_uid, metric_type, tags in self.series
+        ]
+        return [
+            [details[series_id][0], int(round(timestamp)), value, details[series_id][1]]
+            for series_id, value, timestamp in zip(self.points, self.values, self.timestamps)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __bool__(self) -> bool:
+        return len(self.points) > 0
+
+    __nonzero__ = __bool__
+
+    def __iter__(self) -> Iterator[Metric]:
+        for series_id, value, timestamp in zip(self.points, self.values, self.timestamps):
+            name, target_uid, metric_type, tags = self.series[series_id]
+            metric = Metric()
+            metric.name = name
+            metric.value = value
+            metric.metric_type = metric_type
+            metric.target_uid = target_uid
+            metric.tags = list(tags)
+            metric.timestamp = datetime.fromtimestamp(timestamp, pytz.utc)
+            yield metric
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "series": self.series,
+            "points": self.points,
+            "values": self.values,
+            "timestamps": self.timestamps,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__()  # type: ignore
+        self.series = state["series"]
+        self.series_ids = {series: series_id for series_id, series in enumerate(self.series)}
+        self.points = state["points"]
+        self.values = state["values"]
+        self.timestamps = state["timestamps"]
+
+
+# Rollup function used when a rollup does not name one.
+DEFAULT_ROLLUPS = {
+    "gauge": "last",
+    "count": "sum",
+    "monotonic_count": "last",
+    "rate": "avg",
+    "histogram": "histogram",
+    "historate": "histogram",
+    "increment": "sum",
+    "decrement": "sum",
+}
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    # Nearest rank of sorted values.
+    return values[max(0, int(math.ceil(percentile * len(values))) - 1)]
+
+
+class MetricRollups:
+    """
+    Rolls the points of a metric series up into one point per cycle, following the `metric_rollups` of the ETL
+    models. A `histogram` rollup sends the `max`, `median`, `avg`, `count` and `95percentile` of the series as
+    `<name>.<aggregate>` metrics. Series without a matching rollup are kept as they are.
+    """
+
+    def __init__(self, rollups: List[MetricRollup]):
+        self.rollups = rollups
+
+    def __bool__(self) -> bool:
+        return len(self.rollups) > 0
+
+    __nonzero__ = __bool__
+
+    def function_for(self, name: str, metric_type: str) -> Optional[str]:
+        for rollup in self.rollups:
+            if rollup.metric_type in (None, metric_type) and fnmatchcase(name, rollup.metric):
+                return rollup.function or DEFAULT_ROLLUPS[metric_type]
+        return None
+
+    def apply(self, buffer: MetricBuffer) -> MetricBuffer:
+        functions = [self.function_for(name, metric_type) for name, _, metric_type, _ in buffer.series]
+        result = MetricBuffer()
+        kept: Dict[int, int] = {}
+        rolled: Dict[int, Tuple[List[float], List[float]]] = {}
+        for series_id, value, timestamp in zip(buffer.points, buffer.values, buffer.timestamps):
+            if functions[series_id] is None:
+                result_id = kept.get(series_id, None)
+                if result_id is None:
+                    name, target_uid, metric_type, tags = buffer.series[series_id]
+                    result_id = kept[series_id] = result.series_id(name, metric_type, tags, target_uid)
+                result.points.append(result_id)
+                result.values.append(value)
+                result.timestamps.append(timestamp)
+            else:
+                values, timestamps = rolled.setdefault(series_id, ([], []))
+                values.append(value)
+                timestamps.append(timestamp)
+        for series_id in sorted(rolled):
+            self._roll_up(result, buffer.series[series_id], functions[series_id], *rolled[series_id])
+        return result
+
+    @staticmethod
+    def _roll_up(
+        result: MetricBuffer, series: Series, function: Optional[str], values: List[float], timestamps: List[float]
+    ):
+        name, target_uid, metric_type, tags = series
+        timestamp = max(timestamps)
+        if function == "histogram":
+            values = sorted(values)
+            aggregates = [
+                ("max", "gauge", values[-1]),
+                ("median", "gauge", _percentile(values, 0.5)),
+                ("avg", "gauge", sum(values) / len(values)),
+                ("count", "count", len(values)),
+                ("95percentile", "gauge", _percentile(values, 0.95)),
+            ]
+            for aggregate, aggregate_type, value in aggregates:
+                result.append(f"{name}.{aggregate}", value, aggregate_type, tags, target_uid, timestamp)
+            return
+        if function == "last":
+            # The most recent point, or the last one added when points share a timestamp.
+            value = values[max(range(len(values)), key=lambda i: (timestamps[i], i))]
+        elif function == "avg":
+            value = sum(values) / len(values)
+        elif function == "max":
+            value = max(values)
+        elif function == "min":
+            value = min(values)
+        else:
+            value = sum(values)
+        result.append(name, value, metric_type, tags, target_uid, timestamp)
@@ -1,6 +1,6 @@
 import json
 from datetime import datetime
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
 
 import pytz
 from schematics import Model
@@ -16,6 +16,13 @@ from schematics.types import (
 )
 from schematics.types import TimestampType as DefaultTimestampType
 from schematics.types import URLType
+from six.moves import intern
+
+
+def intern_string(value: Any) -> Any:
+    # Types, names and ids repeat across components, relations and metrics, so they share one string instance.
+    # Only native strings can be interned on Python 2; unicode and other values are returned as they are.
+    return intern(value) if type(value) is str else value
 
 
 def to_json(item: Union[Model, List[Model]]) -> str:
@@ -38,6 +45,100 @@ class TimestampType(DefaultTimestampType):
         return int(round(value.timestamp()))  # seconds
 
 
+class UniqueList(list):
+    """
+    Insertion ordered list that ignores values it already holds, with O(1) membership checks. It is still a `list`,
+    so it serialises exactly like one.
+    """
+
+    __slots__ = ("_members",)
+
+    # Short lists are scanned, a set of the members is only kept once a list grows past this size.
+    SCAN_LIMIT = 8
+
+    def __init__(self, items: Iterable[Any] = ()):
+        list.__init__(self)
+        self._members: Optional[Set[Any]] = None
+        self.extend(items)
+
+    def __reduce__(self):
+        return UniqueList, (list(self),)
+
+    def __contains__(self, item: Any) -> bool:
+        if self._members is None:
+            return list.__contains__(self, item)
+        return item in self._members
+
+    def append(self, item: Any):
+        if item not in self:
+            list.append(self, item)
+            self._add_member(item)
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items: Iterable[Any]) -> "UniqueList":  # type: ignore
+        self.extend(items)
+        return self
+
+    def __imul__(self, times: int) -> "UniqueList":  # type: ignore
+        # Repeating the items adds nothing new, only emptying the list changes it.
+        if times <= 0:
+            self.clear()
+        return self
+
+    def clear(self):
+        list.__delitem__(self, slice(None))
+        self._members = None
+
+    def insert(self, index: int, item: Any):  # type: ignore
+        if item not in self:
+            list.insert(self, index, item)
+            self._add_member(item)
+
+    def remove(self, item: Any):
+        list.remove(self, item)
+        if self._members is not None:
+            self._members.discard(item)
+
+    def pop(self, index: int = -1) -> Any:  # type: ignore
+        item = list.pop(self, index)
+        if self._members is not None:
+            self._members.discard(item)
+        return item
+
+    def __setitem__(self, index: Any, value: Any):
+        items = list(self)
+        items[index] = value
+        self._reset(items)
+
+    def __delitem__(self, index: Any):
+        items = list(self)
+        del items[index]
+        self._reset(items)
+
+    def _add_member(self, item: Any):
+        if self._members is not None:
+            self._members.add(item)
+        elif len(self) > self.SCAN_LIMIT:
+            self._members = set(self)
+
+    def _reset(self, items: List[Any]):
+        list.__init__(self)
+        self._members = None
+        self.extend(items)
+
+
+class UniqueListType(ListType):
+    """`ListType` whose native value is a `UniqueList`."""
+
+    native_type = UniqueList
+
+    def _convert(self, value, context):
+        return UniqueList(ListType._convert(self, value, context))
+
+
 class ComponentType(Model):
     name: str = StringType(required=True)
 
@@ -73,8 +174,8 @@ class ComponentProperties(Model):
     layer: str = StringType(default="Unknown")
     domain: str = StringType(default="Unknown")
     environment: str = StringType(default="Unknown")
-    labels: List[str] = ListType(StringType(), default=[])
-    identifiers: List[str] = ListType(StringType(), default=[])
+    labels: List[str] = UniqueListType(StringType(), default=[])
+    identifiers: List[str] = UniqueListType(StringType(), default=[])
     custom_properties: Dict[str, Any] = DictType(AnyType(), default={})
 
     class Options:
@@ -87,8 +188,7 @@ class ComponentProperties(Model):
         self.labels.append(f"{key}:{value}")
 
     def add_identifier(self, identifier: str):
-        if identifier not in self.identifiers:
-            self.identifiers.append(identifier)
+        self.identifiers.append(identifier)
 
     def update_properties(self, properties: Dict[str, Any]):
         self.custom_properties.update(properties)
@@ -100,10 +200,9 @@ class ComponentProperties(Model):
         return self.custom_properties[name]
 
     def dedup_labels(self):
-        labels = set(self.labels)
-        self.labels = list(labels)
-        identifiers = set(self.identifiers)
-        self.identifiers = list(identifiers)
+        # Labels and identifiers assigned as plain lists are only deduplicated once converted.
+        self.labels = UniqueList(self.labels)
+        self.identifiers = UniqueList(self.identifiers)
 
 
 class Component(Model):
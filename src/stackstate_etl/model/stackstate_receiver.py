@@ -82,10 +82,20 @@ class ReceiverApi(Model):
         roles = {"public": wholelist()}
 
 
+class RelationResolutionStats(Model):
+    resolved_by_uid: int = IntType(default=0)
+    resolved_by_name: int = IntType(default=0)
+    resolved_by_identifier: int = IntType(default=0)
+    unresolved: int = IntType(default=0)
+
+
 class SyncStats(Model):
     components: int = IntType()
     relations: int = IntType()
     checks: int = IntType()
     events: int = IntType()
+    events_deduplicated: int = IntType(default=0)
+    events_dropped: int = IntType(default=0)
     metrics: int = IntType()
+    relation_resolution: RelationResolutionStats = ModelType(RelationResolutionStats, default=None)
     payloads: List[str] = ListType(StringType, default=[])
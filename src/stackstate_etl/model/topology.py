@@ -0,0 +1,445 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from schematics.exceptions import ConversionError, DataError
+from six import binary_type, integer_types, string_types
+
+from stackstate_etl.model.stackstate import (
+    Component,
+    ComponentProperties,
+    Relation,
+    UniqueList,
+    intern_string,
+)
+
+UNKNOWN = "Unknown"
+
+
+def _to_string(value: Any) -> str:
+    # Same casts as schematics `StringType`.
+    if isinstance(value, string_types):
+        return value
+    if isinstance(value, binary_type):
+        return value.decode("utf-8")
+    if isinstance(value, integer_types) and not isinstance(value, bool):
+        return str(value)
+    raise ConversionError(f"Couldn't interpret '{value}' as string.")
+
+
+def _required_string(value: Any) -> str:
+    if value is None:
+        raise ConversionError("This field is required.")
+    return intern_string(_to_string(value))
+
+
+def _to_dict(value: Any) -> Dict[str, Any]:
+    # Same casts as schematics `DictType`, without copying a dict that is already one.
+    if isinstance(value, dict):
+        return value
+    return ComponentProperties.fields["custom_properties"].convert(value)
+
+
+class TypeView:
+    """Stands in for the `ComponentType` model of a component or relation, e.g. `component.component_type.name`."""
+
+    __slots__ = ("owner",)
+
+    def __init__(self, owner: Any):
+        self.owner = owner
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.owner.type_name
+
+    @name.setter
+    def name(self, name: str):
+        self.owner.set_type(name)
+
+
+class TopologyRelation:
+    """Lightweight, slotted counterpart of the `Relation` model, converted with `to_model` when published."""
+
+    __slots__ = ("external_id", "source_id", "target_id", "type_name", "_properties")
+
+    def __init__(self, source_id: str, target_id: str, external_id: str, rel_type: Optional[str] = None):
+        self.source_id = source_id
+        self.target_id = target_id
+        self.external_id = external_id
+        self.type_name = intern_string(rel_type)
+        self._properties: Optional[Dict[str, Any]] = None
+
+    @property
+    def properties(self) -> Dict[str, Any]:
+        # Most relations never get properties, so they are only allocated when used.
+        if self._properties is None:
+            self._properties = {"labels": []}
+        return self._properties
+
+    @properties.setter
+    def properties(self, properties: Dict[str, Any]):
+        self._properties = properties
+
+    @property
+    def relation_type(self) -> Optional[TypeView]:
+        return None if self.type_name is None else TypeView(self)
+
+    def set_type(self, name: str):
+        self.type_name = intern_string(name)
+
+    def get_type(self) -> str:
+        return "" if self.type_name is None else self.type_name
+
+    def validate(self):
+        """Checks and converts the fields like `Relation.validate` does, raising the same `DataError`."""
+        errors: Dict[str, Any] = {}
+        for field, name in (("external_id", "externalId"), ("source_id", "sourceId"), ("target_id", "targetId")):
+            value = getattr(self, field)
+            if not isinstance(value, string_types):
+                try:
+                    setattr(self, field, _required_string(value))
+                except ConversionError as e:
+                    errors[name] = e
+        if self.type_name is not None and not isinstance(self.type_name, string_types):
+            try:
+                self.type_name = intern_string(_to_string(self.type_name))
+            except ConversionError as e:
+                errors["type"] = {"name": e}
+        if self._properties is not None:
+            try:
+                self._properties = _to_dict(self._properties)
+            except ConversionError as e:
+                errors["data"] = e
+        if errors:
+            raise DataError(errors)
+
+    def to_native(self) -> Dict[str, Any]:
+        return {
+            "externalId": self.external_id,
+            "type": None if self.type_name is None else {"name": self.type_name},
+            "sourceId": self.source_id,
+            "targetId": self.target_id,
+            "data": {"labels": []} if self._properties is None else self._properties,
+        }
+
+    def to_model(self) -> Relation:
+        return Relation(self.to_native())
+
+    @staticmethod
+    def from_relation(relation: Any) -> "TopologyRelation":
+        light = TopologyRelation(relation.source_id, relation.target_id, relation.external_id)
+        if relation.relation_type is not None:
+            light.type_name = intern_string(relation.relation_type.name)
+        light.properties = relation.properties
+        return light
+
+
+class TopologyProperties:
+    """
+    Lightweight, slotted counterpart of the `ComponentProperties` model. Name and identifier changes are reported to
+    the component that owns the properties.
+    """
+
+    __slots__ = ("_name", "_layer", "_domain", "_environment", "_labels", "_identifiers", "custom_properties", "_owner")
+
+    def __init__(self, owner: Any = None):
+        self._owner = owner
+        self._name: Optional[str] = None
+        self._layer = UNKNOWN
+        self._domain = UNKNOWN
+        self._environment = UNKNOWN
+        self._labels = UniqueList()
+        self._identifiers = UniqueList()
+        self.custom_properties: Dict[str, Any] = {}
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._name
+
+    @name.setter
+    def name(self, name: Optional[str]):
+        self._name = name
+        self._changed()
+
+    @property
+    def layer(self) -> str:
+        return self._layer
+
+    @layer.setter
+    def layer(self, layer: str):
+        self._layer = intern_string(layer)
+
+    @property
+    def domain(self) -> str:
+        return self._domain
+
+    @domain.setter
+    def domain(self, domain: str):
+        self._domain = intern_string(domain)
+
+    @property
+    def environment(self) -> str:
+        return self._environment
+
+    @environment.setter
+    def environment(self, environment: str):
+        self._environment = intern_string(environment)
+
+    @property
+    def labels(self) -> UniqueList:
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels: Iterable[str]):
+        self._labels = labels if isinstance(labels, UniqueList) else UniqueList(labels or [])
+
+    @property
+    def identifiers(self) -> UniqueList:
+        return self._identifiers
+
+    @identifiers.setter
+    def identifiers(self, identifiers: Iterable[str]):
+        self._identifiers = identifiers if isinstance(identifiers, UniqueList) else UniqueList(identifiers or [])
+        self._changed()
+
+    def add_label(self, label: str):
+        self._labels.append(label)
+
+    def add_label_kv(self, key: str, value: str):
+        self._labels.append(f"{key}:{value}")
+
+    def add_identifier(self, identifier: str):
+        self._identifiers.append(identifier)
+        self._changed()
+
+    def _changed(self):
+        if self._owner is not None:
+            self._owner._index_changed()
+
+    def update_properties(self, properties: Dict[str, Any]):
+        self.custom_properties.update(properties)
+
+    def add_property(self, name: str, value: Any):
+        self.custom_properties[name] = value
+
+    def get_property(self, name: str):
+        return self.custom_properties[name]
+
+    def dedup_labels(self):
+        # Labels and identifiers are always unique.
+        pass
+
+    def to_native(self) -> Dict[str, Any]:
+        return {
+            "name": self._name,
+            "layer": self._layer,
+            "domain": self._domain,
+            "environment": self._environment,
+            "labels": list(self._labels),
+            "identifiers": list(self._identifiers),
+            "custom_properties": self.custom_properties,
+        }
+
+
+class TopologyComponent:
+    """
+    Lightweight, slotted counterpart of the `Component` model that interpreters and the `TopologyFactory` work with.
+    It has the same methods as the model and is converted with `to_model` when published.
+    """
+
+    __slots__ = ("uid", "type_name", "properties", "relations", "mergeable", "_index")
+
+    uid: str
+    type_name: Optional[str]
+    relations: List[Any]
+
+    def __init__(self):
+        self.uid = None
+        self.type_name = None
+        self.properties = TopologyProperties(self)
+        self.relations = []
+        self.mergeable = False
+        self._index = None
+
+    @property
+    def component_type(self) -> Optional[TypeView]:
+        return None if self.type_name is None else TypeView(self)
+
+    @component_type.setter
+    def component_type(self, component_type: Any):
+        if component_type is None or isinstance(component_type, string_types):
+            self.set_type(component_type)
+        elif isinstance(component_type, dict):
+            self.set_type(component_type.get("name", None))
+        else:
+            self.set_type(component_type.name)
+
+    def set_type(self, name: Optional[str]):
+        self.type_name = intern_string(name)
+        self._index_changed()
+
+    def get_type(self) -> str:
+        return self.type_name  # type: ignore
+
+    def get_name(self) -> str:
+        return self.properties.name  # type: ignore
+
+    def set_name(self, name: str):
+        self.properties.name = name
+
+    def add_identifier(self, identifier: str):
+        self.properties.add_identifier(identifier)
+
+    def _index_changed(self):
+        # `_index` is the `ComponentIndex` of the factory that stores this component, once it was added.
+        if self._index is not None:
+            self._index.update(self)
+
+    def merge(self, source: "TopologyComponent"):
+        self.relations.extend(source.relations)
+        self.properties.labels.extend(source.properties.labels)
+        self.properties.identifiers.extend(source.properties.identifiers)
+        self.properties.custom_properties.update(source.properties.custom_properties)
+
+    def cast_keys(self):
+        """
+        Converts the uid and name, which the factory stores and indexes the component by, to strings like `validate`
+        does. Missing values are left to `validate`.
+        """
+        errors: Dict[str, Any] = {}
+        if self.uid is not None and not isinstance(self.uid, string_types):
+            try:
+                uid, self.uid = self.uid, intern_string(_to_string(self.uid))
+                # Relations added before the cast refer to the component by its original uid.
+                for relation in self.relations:
+                    if relation.source_id == uid:
+                        relation.source_id = self.uid
+                    if relation.target_id == uid:
+                        relation.target_id = self.uid
+            except ConversionError as e:
+                errors["externalId"] = e
+        if self.properties.name is not None and not isinstance(self.properties.name, string_types):
+            try:
+                self.properties.name = _to_string(self.properties.name)
+            except ConversionError as e:
+                errors["data"] = {"name": e}
+        if errors:
+            raise DataError(errors)
+
+    def validate(self):
+        """Checks and converts the fields like `Component.validate` does, raising the same `DataError`."""
+        errors: Dict[str, Any] = {}
+        properties = self.properties
+        try:
+            if self.uid is None:
+                raise ConversionError("This field is required.")
+            self.uid = intern_string(_to_string(self.uid))
+        except ConversionError as e:
+            errors["externalId"] = e
+        property_errors: Dict[str, Any] = {}
+        try:
+            if properties.name is None:
+                raise ConversionError("This field is required.")
+            properties.name = _to_string(properties.name)
+        except ConversionError as e:
+            property_errors["name"] = e
+        for field in ("layer", "domain", "environment"):
+            value = getattr(properties, field)
+            if value is not None and not isinstance(value, string_types):
+                try:
+                    setattr(properties, field, _to_string(value))
+                except ConversionError as e:
+                    property_errors[field] = e
+        for field in ("labels", "identifiers"):
+            values = getattr(properties, field)
+            if not all(isinstance(value, string_types) for value in values):
+                try:
+                    setattr(properties, field, UniqueList(_to_string(value) for value in values))
+                except ConversionError as e:
+                    property_errors[field] = e
+        if properties.custom_properties is not None:
+            try:
+                properties.custom_properties = _to_dict(properties.custom_properties)
+            except ConversionError as e:
+                property_errors["custom_properties"] = e
+        if property_errors:
+            errors["data"] = property_errors
+        if self.type_name is not None and not isinstance(self.type_name, string_types):
+            try:
+                self.type_name = intern_string(_to_string(self.type_name))
+            except ConversionError as e:
+                errors["type"] = {"name": e}
+        relation_errors: Dict[int, Any] = {}
+        for position, relation in enumerate(self.relations):
+            try:
+                relation.validate()
+            except DataError as e:
+                relation_errors[position] = e.errors
+        if relation_errors:
+            errors["relations"] = relation_errors
+        if self.mergeable is not None and not isinstance(self.mergeable, bool):
+            try:
+                self.mergeable = Component.fields["mergeable"].convert(self.mergeable)
+            except ConversionError as e:
+                errors["mergeable"] = e
+        if errors:
+            raise DataError(errors)
+
+    def to_native(self) -> Dict[str, Any]:
+        return {
+            "externalId": self.uid,
+            "type": None if self.type_name is None else {"name": self.type_name},
+            "data": self.properties.to_native(),
+            "relations": [
+                r.to_native() if isinstance(r, TopologyRelation) else TopologyRelation.from_relation(r).to_native()
+                for r in self.relations
+            ],
+            "mergeable": self.mergeable,
+        }
+
+    def to_primitive(self, *args, **kwargs) -> Dict[str, Any]:
+        return self.to_model().to_primitive(*args, **kwargs)
+
+    def to_model(self) -> Component:
+        return Component(self.to_native())
+
+    @staticmethod
+    def from_native(data: Dict[str, Any]) -> "TopologyComponent":
+        component = TopologyComponent()
+        component.uid = data["externalId"]
+        component_type = data.get("type", None)
+        component.type_name = intern_string(component_type["name"]) if component_type else None
+        properties = data["data"]
+        component.properties.name = properties["name"]
+        component.properties.layer = properties["layer"]
+        component.properties.domain = properties["domain"]
+        component.properties.environment = properties["environment"]
+        component.properties.labels = properties["labels"]
+        component.properties.identifiers = properties["identifiers"]
+        component.properties.custom_properties = properties["custom_properties"]
+        for relation in data.get("relations", []):
+            light = TopologyRelation(relation["sourceId"], relation["targetId"], relation["externalId"])
+            light.type_name = intern_string(relation["type"]["name"]) if relation.get("type", None) else None
+            light.properties = relation.get("data", {"labels": []})
+            component.relations.append(light)
+        component.mergeable = data.get("mergeable", False)
+        return component
+
+    @staticmethod
+    def from_component(component: Any) -> "TopologyComponent":
+        """Converts a `Component` model, e.g. one built by processor code, into the factory representation."""
+        light = TopologyComponent()
+        light.uid = component.uid
+        if component.component_type is not None:
+            light.type_name = intern_string(component.component_type.name)
+        properties = component.properties
+        light.properties.name = properties.name
+        light.properties.layer = properties.layer
+        light.properties.domain = properties.domain
+        light.properties.environment = properties.environment
+        light.properties.labels = properties.labels or []
+        light.properties.identifiers = properties.identifiers or []
+        light.properties.custom_properties = properties.custom_properties or {}
+        light.relations = [
+            r if isinstance(r, TopologyRelation) else TopologyRelation.from_relation(r) for r in component.relations
+        ]
+        light.mergeable = component.mergeable
+        return light
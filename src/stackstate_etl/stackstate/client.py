@@ -3,12 +3,14 @@ import json
 import logging
 import zlib
 from hashlib import md5
-from typing import Dict, List
+from typing import Any, Dict, Iterable, List, Optional, Union
 from urllib.parse import quote
 
 import requests
 
+from stackstate_etl.model.events import EventBuffer
 from stackstate_etl.model.instance import StackStateSpec
+from stackstate_etl.model.metrics import MetricBuffer
 from stackstate_etl.model.stackstate import (
     Component,
     Event,
@@ -39,15 +41,22 @@ class StackStateClient:
         payload = self._prepare_health_sync_payload(health_checks)
         return self._post_data(payload, dry_run, stats)
 
-    def publish_events(self, events: List[Event], dry_run=False, stats=SyncStats()) -> SyncStats:
+    def publish_events(self, events: Union[EventBuffer, List[Event]], dry_run=False, stats=SyncStats()) -> SyncStats:
         stats.events = len(events)
         payload = self._prepare_event_sync_payload(events)
         return self._post_data(payload, dry_run, stats)
 
-    def publish_metrics(self, metrics: List[Metric], dry_run=False, stats=SyncStats()) -> SyncStats:
+    def publish_metrics(
+        self, metrics: Union[MetricBuffer, Iterable[Metric]], dry_run=False, stats=SyncStats()
+    ) -> SyncStats:
+        if not isinstance(metrics, MetricBuffer):
+            buffer = MetricBuffer()
+            for metric in metrics:
+                buffer.append_metric(metric)
+            metrics = buffer
         stats.metrics = len(metrics)
-        payload = self._prepare_metric_sync_payload(metrics)
-        return self._post_data(payload, dry_run, stats)
+        # Metric points skip the schematics conversion and are added to the serialised payload directly.
+        return self._post_data(self._prepare_receiver_payload(), dry_run, stats, metrics.to_receiver())
 
     def publish(
         self, components: List[Component], relations: List[Relation], dry_run=False, stats=SyncStats()
@@ -57,11 +66,16 @@ class StackStateClient:
         payload = self._prepare_topo_payload(components, relations)
         return self._post_data(payload, dry_run, stats)
 
-    def _post_data(self, payload: ReceiverApi, dry_run: bool, stats: SyncStats) -> SyncStats:
+    def _post_data(
+        self, payload: ReceiverApi, dry_run: bool, stats: SyncStats, metrics: Optional[List[List[Any]]] = None
+    ) -> SyncStats:
+        primitive = payload.to_primitive(role="public")
+        if metrics is not None:
+            primitive["metrics"] = metrics
         if dry_run:
-            stats.payloads.append(json.dumps(payload.to_primitive(role="public"), indent=4))
+            stats.payloads.append(json.dumps(primitive, indent=4))
             return stats
-        serialized_payload = json.dumps(payload.to_primitive(role="public"))
+        serialized_payload = json.dumps(primitive)
 
         zipped = zlib.compress(serialized_payload.encode("utf-8"))
         logging.debug(
@@ -96,26 +110,13 @@ class StackStateClient:
         payload.health = [sync]
         return payload
 
-    def _prepare_event_sync_payload(self, events: List[Event]) -> ReceiverApi:
+    def _prepare_event_sync_payload(self, events: Iterable[Event]) -> ReceiverApi:
         payload = self._prepare_receiver_payload()
         for event in events:
             event_list = payload.events.setdefault(event.event_type, [])
             event_list.append(event)
         return payload
 
-    def _prepare_metric_sync_payload(self, metrics: List[Metric]) -> ReceiverApi:
-        payload = self._prepare_receiver_payload()
-        for metric in metrics:
-            timestamp_in_secs = int(round(metric.timestamp.timestamp()))
-            metric_list = {
-                metric.name,
-                timestamp_in_secs,
-                metric.value,
-                {"hostname": metric.target_uid, "tags": metric.tags, "type": metric.metric_type},
-            }
-            payload.metrics.append(metric_list)
-        return payload
-
     def _prepare_topo_payload(self, components: List[Component], relations: List[Relation]) -> ReceiverApi:
         instance = Instance()
         instance.instance_type = self.config.instance_type
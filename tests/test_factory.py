@@ -0,0 +1,705 @@
+import json
+import logging
+import pickle
+import random
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+import pytest
+import pytz
+from schematics.exceptions import DataError
+
+from stackstate_etl.model.etl import MetricRollup
+from stackstate_etl.model.events import DROP_OLDEST, EventBuffer
+from stackstate_etl.model.factory import (
+    DEFERRED,
+    IGNORE,
+    LENIENT,
+    SAMPLED,
+    STRICT,
+    TopologyFactory,
+)
+from stackstate_etl.model.instance import InstanceInfo, StackStateSpec
+from stackstate_etl.model.metrics import MetricBuffer, MetricRollups
+from stackstate_etl.model.stackstate import (
+    Component,
+    Event,
+    Metric,
+    Relation,
+    UniqueList,
+)
+from stackstate_etl.model.stackstate_receiver import SyncStats
+from stackstate_etl.model.topology import TopologyComponent, TopologyRelation
+from stackstate_etl.stackstate.client import StackStateClient
+
+logger = logging.getLogger("stackstate_etl")
+
+
+def _traced(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """Result of `build` and the bytes it holds on to, as traced by tracemalloc."""
+    tracemalloc.start()
+    try:
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def _component(uid: str, name: str, component_type: str = "host", mergeable: bool = False) -> TopologyComponent:
+    component = TopologyFactory.new_component()
+    component.uid = uid
+    component.set_name(name)
+    component.set_type(component_type)
+    component.mergeable = mergeable
+    return component
+
+
+def _scan(factory: TopologyFactory, predicate):
+    return [c.uid for c in factory.components.values() if predicate(c)]
+
+
+def test_component_index_matches_scan():
+    rnd = random.Random(7)
+    factory = TopologyFactory(mode=IGNORE)
+    names = [f"host-{i}.example.com" for i in range(20)] + [f"db-{i}.example.org" for i in range(10)]
+    for i in range(200):
+        factory.add_component(_component(f"urn:c:{i}", rnd.choice(names), rnd.choice(["host", "db"])))
+    for i in range(0, 200, 7):
+        factory.get_component(f"urn:c:{i}").set_name(rnd.choice(names))
+    for i in range(0, 200, 11):
+        factory.get_component(f"urn:c:{i}").set_type(rnd.choice(["host", "db", "vm"]))
+    # Names assigned directly on the properties are indexed as well.
+    for i in range(0, 200, 13):
+        factory.get_component(f"urn:c:{i}").properties.name = rnd.choice(names)
+    # A merge replaces the stored component with the incoming one.
+    factory.add_component(_component("urn:c:3", "replaced.example.com", "vm"))
+    factory.get_component("urn:c:5").mergeable = True
+    factory.add_component(_component("urn:c:5", "merged.example.com", "vm"))
+
+    index = factory.component_index
+    for name in names + ["replaced.example.com", "merged.example.com", "missing"]:
+        assert [c.uid for c in index.find_by_name(name)] == _scan(factory, lambda c: c.get_name() == name)
+        for component_type in ["host", "db", "vm"]:
+            assert [c.uid for c in index.find_by_type_and_name(component_type, name)] == _scan(
+                factory, lambda c: c.get_type() == component_type and c.get_name() == name
+            )
+    for postfix in [".com", ".org", "1.example.com", "host-1.example.com", "", "nothing"]:
+        assert [c.uid for c in index.find_by_name_postfix(postfix)] == _scan(
+            factory, lambda c: c.get_name().endswith(postfix)
+        )
+
+
+def test_component_lookups_keep_error_semantics():
+    factory = TopologyFactory(mode=STRICT)
+    factory.add_component(_component("urn:a", "alpha.example.com"))
+    factory.add_component(_component("urn:b", "beta.example.com", "db"))
+    factory.add_component(_component("urn:c", "beta.example.com", "db"))
+    assert factory.get_component_by_name("alpha.example.com").uid == "urn:a"
+    assert factory.get_component_by_name_and_type("host", "alpha.example.com").uid == "urn:a"
+    assert factory.get_component_by_name_and_type("db", "alpha.example.com", raise_not_found=False) is None
+    assert factory.get_component_by_name_postfix("alpha.example.com").uid == "urn:a"
+    assert factory.get_component_by_name_postfix("nothing") is None
+    assert factory.get_component_by_name("missing", raise_not_found=False) is None
+    with pytest.raises(Exception, match="not found"):
+        factory.get_component_by_name("missing")
+    with pytest.raises(Exception, match="More than 1 result"):
+        factory.get_component_by_name("beta.example.com")
+    with pytest.raises(Exception, match="More than 1 result"):
+        factory.get_component_by_name_postfix(".example.com")
+    factory.mode = LENIENT
+    assert factory.get_component_by_name_and_type("db", "beta.example.com").uid == "urn:b"
+
+
+def test_component_lookups_do_not_scan(monkeypatch):
+    factory = TopologyFactory()
+    for i in range(1000):
+        factory.add_component(_component(f"urn:host:{i}", f"host-{i}.example.com"))
+    read_names = []
+    get_name = TopologyComponent.get_name
+    monkeypatch.setattr(TopologyComponent, "get_name", lambda c: read_names.append(c.uid) or get_name(c))
+    for i in range(0, 1000, 10):
+        assert factory.get_component_by_name(f"host-{i}.example.com").uid == f"urn:host:{i}"
+        assert factory.get_component_by_name_and_type("host", f"host-{i}.example.com").uid == f"urn:host:{i}"
+        assert factory.get_component_by_name_postfix(f"-{i}.example.com").uid == f"urn:host:{i}"
+    assert read_names == []
+
+
+def test_resolve_relations_reports_resolution():
+    factory = TopologyFactory(mode=LENIENT)
+    host = _component("urn:host:1", "host-1.example.com")
+    factory.add_component_relations(host, ["urn:disk:1", "disk-2.example.com|attached", "<switch-1", "missing"])
+    factory.add_component(host)
+    factory.add_component(_component("urn:disk:1", "disk-1.example.com", "disk"))
+    factory.add_component(_component("urn:disk:2", "disk-2.example.com", "disk"))
+    factory.add_component(_component("urn:switch:1", "switch-1", "switch"))
+    stats = factory.resolve_relations()
+    assert (stats.resolved_by_uid, stats.resolved_by_name, stats.unresolved) == (1, 2, 1)
+    assert factory.relation_exists("urn:host:1", "urn:disk:1")
+    assert factory.get_relation("urn:host:1", "urn:disk:2").get_type() == "attached"
+    # A reverse relation that is resolved by name points from the named component to the source.
+    assert factory.relation_exists("urn:switch:1", "urn:host:1")
+    assert host.relations == []
+
+
+def test_resolve_relations_by_name_in_bulk():
+    factory = TopologyFactory()
+    for i in range(2000):
+        component = _component(f"urn:host:{i}", f"host-{i}")
+        factory.add_component_relations(component, [f"host-{(i + 1) % 2000}", f"host-{(i + 2) % 2000}"])
+        factory.add_component(component)
+    # Adding components does not keep the postfix search list sorted until the first postfix search builds it.
+    assert factory.component_index.reversed_names is None
+    assert factory.get_component_by_name_postfix("-1999").uid == "urn:host:1999"
+    assert len(factory.component_index.reversed_names) == 2000
+    assert factory.resolve_relations().resolved_by_name == 4000
+    assert len(factory.relations) == 4000
+    # From then on names are kept sorted as components are added and renamed.
+    factory.add_component(_component("urn:host:2000", "host-2000"))
+    factory.get_component("urn:host:0").set_name("host-2001")
+    assert factory.get_component_by_name_postfix("-2000").uid == "urn:host:2000"
+    assert factory.get_component_by_name_postfix("-2001").uid == "urn:host:0"
+    assert factory.component_index.reversed_names == sorted(factory.component_index.reversed_names)
+    assert len(factory.component_index.reversed_names) == 2001
+
+
+def test_resolve_relations_by_identifier():
+    factory = TopologyFactory(mode=STRICT)
+    host = _component("urn:host:1", "host-1")
+    factory.add_component_relations(host, ["10.0.0.5", "<lb.example.com|routes"])
+    factory.add_component(host)
+    vm = _component("urn:vm:1", "vm-1", "vm")
+    vm.properties.identifiers.append("10.0.0.5")
+    factory.add_component(vm)
+    balancer = _component("urn:lb:1", "lb-1", "lb")
+    factory.add_component(balancer)
+    # Identifiers added after the component was stored are indexed as well.
+    balancer.add_identifier("lb.example.com")
+    stats = factory.resolve_relations()
+    assert (stats.resolved_by_uid, stats.resolved_by_name, stats.resolved_by_identifier) == (0, 0, 2)
+    assert factory.relation_exists("urn:host:1", "urn:vm:1")
+    assert factory.get_relation("urn:lb:1", "urn:host:1").get_type() == "routes"
+
+
+def test_resolve_relations_with_ambiguous_identifier():
+    def build(mode):
+        factory = TopologyFactory(mode=mode)
+        host = _component("urn:host:1", "host-1")
+        factory.add_component_relations(host, ["arn:aws:shared"])
+        factory.add_component(host)
+        for i in range(2):
+            claimant = _component(f"urn:vm:{i}", f"vm-{i}", "vm")
+            claimant.properties.identifiers.append("arn:aws:shared")
+            factory.add_component(claimant)
+        return factory
+
+    with pytest.raises(Exception, match="More than 1 component claims identifier arn:aws:shared"):
+        build(STRICT).resolve_relations()
+    lenient = build(LENIENT)
+    lenient.resolve_relations()
+    assert lenient.relation_exists("urn:host:1", "urn:vm:0")
+
+
+def _relation_graph(incremental: bool) -> TopologyFactory:
+    rnd = random.Random(3)
+    factory = TopologyFactory(mode=LENIENT, incremental_relations=incremental)
+    for i in range(300):
+        component = _component(f"urn:host:{i}", f"host-{i}")
+        if i % 10 == 0:
+            component.properties.identifiers.append(f"10.0.0.{i}")
+        references = [f"urn:host:{rnd.randrange(400)}", f"host-{rnd.randrange(400)}", f"<10.0.0.{rnd.randrange(400)}"]
+        factory.add_component_relations(component, references)
+        factory.add_component(component)
+    return factory
+
+
+def test_incremental_relations_match_batch_resolution():
+    batch = _relation_graph(incremental=False)
+    incremental = _relation_graph(incremental=True)
+    assert all(c.relations == [] for c in incremental.components.values())
+    # Only uid references to components that do not exist yet, and name or identifier references, are waiting.
+    assert len(incremental.relations) == incremental.relation_stats.resolved_by_uid
+    assert all(reference not in incremental.components for reference in incremental.pending_relations)
+    batch_stats = batch.resolve_relations()
+    incremental_stats = incremental.resolve_relations()
+    assert incremental_stats.to_native() == batch_stats.to_native()
+    assert sorted(incremental.relations) == sorted(batch.relations)
+    assert incremental.pending_relations == {}
+
+
+def test_incremental_relations_across_merged_factories():
+    first = TopologyFactory(incremental_relations=True)
+    host = _component("urn:host:1", "host-1")
+    first.add_component_relations(host, ["urn:disk:1"])
+    first.add_component(host)
+    second = TopologyFactory(incremental_relations=True)
+    second.add_component(_component("urn:disk:1", "disk-1", "disk"))
+    assert first.pending_relations == {"urn:disk:1": [("urn:host:1", "urn:host:1", "urn:disk:1", "uses")]}
+    first.merge(second)
+    assert first.pending_relations == {}
+    assert first.relation_exists("urn:host:1", "urn:disk:1")
+
+
+def test_relation_store_keeps_factory_api():
+    factory = TopologyFactory()
+    relation = factory.add_relation("urn:a", "urn:b", "runs_on")
+    relation.properties["labels"].append("edited")
+    factory.add_relation("urn:b", "urn:c")
+    assert factory.relation_exists("urn:a", "urn:b")
+    assert not factory.relation_exists("urn:b", "urn:a")
+    assert "urn:b --> urn:c" in factory.relations
+    assert sorted(factory.relations) == ["urn:a --> urn:b", "urn:b --> urn:c"]
+    assert factory.get_relation("urn:a", "urn:b") is relation
+    assert factory.relations["urn:b --> urn:c"].get_type() == "uses"
+    with pytest.raises(Exception, match="already exists"):
+        factory.add_relation("urn:a", "urn:b")
+
+    copy = pickle.loads(pickle.dumps(factory))
+    assert [r.to_primitive() for r in copy.relations.values()] == [r.to_primitive() for r in factory.relations.values()]
+    assert copy.get_relation("urn:a", "urn:b").properties["labels"] == ["edited"]
+
+
+def test_relation_store_memory_benchmark():
+    edges = [(f"urn:host:{i}", f"urn:disk:{i % 1000}") for i in range(5000)]
+
+    def models():
+        relations = {}
+        for source_id, target_id in edges:
+            rel_id = f"{source_id} --> {target_id}"
+            relation = Relation({"source_id": source_id, "target_id": target_id, "external_id": rel_id})
+            relation.set_type("uses")
+            relations[rel_id] = relation
+        return relations
+
+    def compact():
+        factory = TopologyFactory()
+        for source_id, target_id in edges:
+            factory._link(source_id, target_id, "uses")
+        return factory.relations
+
+    models_store, model_size = _traced(models)
+    compact_store, compact_size = _traced(compact)
+    assert len(models_store) == len(compact_store) == len(edges)
+    logger.info(f"5000 relations: models={model_size / 1e6:.1f}MB compact={compact_size / 1e6:.1f}MB")
+    assert compact_size * 5 < model_size
+
+
+def test_merged_components_keep_unique_labels_and_identifiers():
+    factory = TopologyFactory()
+    for i in range(5):
+        component = _component("urn:host:1", "host-1", mergeable=i > 0)
+        component.properties.labels.extend(["os:linux", f"template:{i}", "os:linux"])
+        component.properties.identifiers.extend(["urn:host:1", "10.0.0.1"])
+        factory.add_component(component)
+    properties = factory.get_component("urn:host:1").properties
+    assert properties.labels == ["os:linux"] + [f"template:{i}" for i in range(5)]
+    assert properties.identifiers == ["urn:host:1", "10.0.0.1"]
+    assert "10.0.0.1" in properties.identifiers
+    primitive = factory.get_component("urn:host:1").to_primitive()["data"]
+    assert type(primitive["labels"]) is list
+    assert primitive["identifiers"] == ["urn:host:1", "10.0.0.1"]
+
+
+def test_unique_list_operations():
+    items = UniqueList(["a", "b", "a"])
+    items += ["c", "b"]
+    items.insert(0, "c")
+    items.insert(0, "z")
+    assert items == ["z", "a", "b", "c"]
+    items[1] = "c"
+    assert items == ["z", "c", "b"] and "a" not in items
+    del items[0]
+    assert items.pop() == "b"
+    items.remove("c")
+    assert items == [] and "c" not in items
+    assert pickle.loads(pickle.dumps(UniqueList(["x", "y"]))) == ["x", "y"]
+    many = UniqueList(str(i % 20) for i in range(40))
+    assert many == [str(i) for i in range(20)] and "19" in many and "20" not in many
+    many.remove("19")
+    assert "19" not in many
+    many *= 2
+    assert len(many) == 19
+    many.clear()
+    assert many == [] and "0" not in many
+    many.append("0")
+    assert many == ["0"]
+    many.extend(str(i) for i in range(20))
+    many *= 0
+    assert many == [] and "5" not in many
+
+
+def _build(component, i: int):
+    component.uid = f"urn:host:{i}"
+    component.set_type("host")
+    component.set_name(f"host-{i}")
+    component.properties.layer = "Machines"
+    component.properties.environment = "Production"
+    component.properties.add_label_kv("os", "linux")
+    component.properties.add_identifier(f"10.0.{i // 256}.{i % 256}")
+    component.properties.add_property("cpus", 4)
+    relations = TopologyComponent()
+    relations.uid = component.uid
+    TopologyFactory.add_component_relations(relations, [f"urn:disk:{i}", "<switch-1|connects"])
+    if isinstance(component, Component):
+        component.relations = [relation.to_model() for relation in relations.relations]
+    else:
+        component.relations = relations.relations
+    return component
+
+
+def test_component_models_are_stored_as_copies():
+    factory = TopologyFactory()
+    model = Component({"externalId": "urn:host:1", "data": {"name": "host-1"}})
+    stored = factory.add_component(model)
+    assert isinstance(stored, TopologyComponent) and factory.get_component("urn:host:1") is stored
+    # Changes to the model after it was added are not seen, changes to the returned component are.
+    model.properties.add_label("late")
+    stored.properties.add_label("stored")
+    assert factory.get_component("urn:host:1").properties.labels == ["stored"]
+    assert factory.get_component_by_name("host-1") is stored
+
+
+def test_topology_component_publishes_like_the_model():
+    component = _build(TopologyComponent(), 1)
+    model = _build(Component(), 1)
+    component.validate()
+    model.validate()
+    assert component.to_native() == model.to_native()
+    assert component.to_model().to_primitive(role="public") == model.to_primitive(role="public")
+    assert TopologyComponent.from_component(model).to_native() == model.to_native()
+    assert TopologyComponent.from_native(model.to_native()).to_native() == model.to_native()
+    assert component.properties.layer is _build(TopologyComponent(), 2).properties.layer
+
+    factory = TopologyFactory()
+    factory.add_component(model)
+    assert isinstance(factory.get_component("urn:host:1"), TopologyComponent)
+    assert factory.get_component_by_name_and_type("host", "host-1").uid == "urn:host:1"
+
+
+def test_topology_component_validation_matches_the_model():
+    for build in (TopologyComponent, Component):
+        with pytest.raises(DataError) as e:
+            build().validate()
+        assert e.value.to_primitive() == {
+            "externalId": ["This field is required."],
+            "data": {"name": ["This field is required."]},
+        }
+        component = build()
+        component.uid = 10
+        component.set_name(3.5)
+        with pytest.raises(DataError) as e:
+            component.validate()
+        assert e.value.to_primitive() == {"data": {"name": ["Couldn't interpret '3.5' as string."]}}
+        assert component.uid == "10"
+
+
+def test_topology_component_validation_covers_all_fields():
+    def host(build):
+        if build is Component:
+            return Component({"externalId": "urn:host:1", "data": {"name": "host-1"}})
+        component = TopologyComponent()
+        component.uid = "urn:host:1"
+        component.set_name("host-1")
+        return component
+
+    for build in (TopologyComponent, Component):
+        component = host(build)
+        component.properties.layer = 5
+        component.properties.domain = [1]
+        component.properties.custom_properties = [1, 2]
+        component.mergeable = "yes"
+        component.relations = [_relation(build, "urn:host:1", 7, "urn:host:1 --> 7"), _relation(build, "a", "b", None)]
+        component.relations[1].properties = "labels"
+        with pytest.raises(DataError) as e:
+            component.validate()
+        assert e.value.to_primitive() == {
+            "data": {
+                "domain": ["Couldn't interpret '[1]' as string."],
+                "custom_properties": ["Only mappings may be used in a DictType"],
+            },
+            "relations": {
+                1: {"externalId": ["This field is required."], "data": ["Only mappings may be used in a DictType"]}
+            },
+            "mergeable": ["Must be either true or false."],
+        }
+        # A failed model validation leaves the model unusable, so the conversions are checked on a new component.
+        component = host(build)
+        component.properties.layer = 5
+        component.mergeable = "true"
+        component.relations = [_relation(build, "urn:host:1", 7, "urn:host:1 --> 7")]
+        component.validate()
+        assert (component.properties.layer, component.mergeable, component.relations[0].target_id) == ("5", True, "7")
+
+
+def _relation(build, source_id, target_id, external_id):
+    if build is Component:
+        relation = Relation()
+        relation.source_id, relation.target_id, relation.external_id = source_id, target_id, external_id
+        return relation
+    return TopologyRelation(source_id, target_id, external_id)
+
+
+def test_topology_component_memory_benchmark():
+    models, model_size = _traced(lambda: [_build(Component(), i) for i in range(2000)])
+    light, light_size = _traced(lambda: [_build(TopologyComponent(), i) for i in range(2000)])
+    assert len(models) == len(light) == 2000
+    logger.info(f"2000 components: models={model_size / 1e6:.1f}MB slotted={light_size / 1e6:.1f}MB")
+    assert light_size * 3 < model_size
+
+
+def test_deferred_validation_reports_all_failures(monkeypatch):
+    validated = []
+    validate = TopologyComponent.validate
+    monkeypatch.setattr(TopologyComponent, "validate", lambda self: validated.append(self.uid) or validate(self))
+
+    eager = TopologyFactory()
+    deferred = TopologyFactory(validation=DEFERRED)
+    for factory in (eager, deferred):
+        for i in range(4):
+            factory.add_component(_component("urn:host:1", "host-1", mergeable=i > 0))
+    assert validated == ["urn:host:1"] * 4
+    assert deferred.validate_components() == 1
+    assert validated == ["urn:host:1"] * 5
+    assert eager.validate_components() == 0
+
+    for uid in ("urn:host:2", "urn:host:3"):
+        component = TopologyComponent()
+        component.uid = uid
+        deferred.add_component(component)
+    with pytest.raises(DataError) as e:
+        deferred.validate_components()
+    assert e.value.to_primitive() == {
+        "urn:host:2": {"data": {"name": ["This field is required."]}},
+        "urn:host:3": {"data": {"name": ["This field is required."]}},
+    }
+
+
+def test_sampled_validation():
+    def unnamed(uid):
+        component = TopologyComponent()
+        component.uid = uid
+        return component
+
+    factory = TopologyFactory(validation=SAMPLED, validation_sample_rate=0)
+    factory.add_component(unnamed("urn:host:1"))
+    with pytest.raises(DataError):
+        # Components without a uid are always validated.
+        factory.add_component(unnamed(None))
+    factory.validation_sample_rate = 1
+    with pytest.raises(DataError):
+        factory.add_component(unnamed("urn:host:2"))
+    factory.validation_sample_rate = 0.5
+    sampled = [uid for uid in (f"urn:host:{i}" for i in range(1000)) if factory._is_sampled(unnamed(uid))]
+    assert 400 < len(sampled) < 600
+
+
+def test_unvalidated_components_are_stored_by_string_uid_and_name():
+    def build(factory):
+        for uid, name in [(5, 7), (6, b"disk-6")]:
+            component = TopologyComponent()
+            component.uid = uid
+            component.properties.name = name
+            component.set_type("host")
+            factory.add_component_relations(component, ["6", "7"] if uid == 5 else [])
+            factory.add_component(component)
+        return factory
+
+    eager = build(TopologyFactory())
+    eager.resolve_relations()
+    for factory in (
+        build(TopologyFactory(validation=DEFERRED)),
+        build(TopologyFactory(validation=SAMPLED, validation_sample_rate=0)),
+    ):
+        assert list(factory.components) == ["5", "6"]
+        assert factory.get_component_by_name("7").uid == "5"
+        assert factory.get_component_by_name_postfix("-6").uid == "6"
+        factory.resolve_relations()
+        assert list(factory.relations) == list(eager.relations) == ["5 --> 6", "5 --> 5"]
+    unconvertible = TopologyComponent()
+    unconvertible.uid = [1]
+    with pytest.raises(DataError) as e:
+        TopologyFactory(validation=DEFERRED).add_component(unconvertible)
+    assert e.value.to_primitive() == {"externalId": ["Couldn't interpret '[1]' as string."]}
+
+
+def test_metric_buffer():
+    factory = TopologyFactory()
+    factory.add_metric_value("cpu", 1, tags=["env:prod"], target_uid="urn:host:1")
+    factory.add_metric_values("cpu", [2, 3.5], tags=["env:prod"], target_uid="urn:host:1", timestamps=[10.0, 20.4])
+    factory.add_metric_values("requests", iter([7]), metric_type="count", target_uid="urn:host:2")
+    metric = Metric()
+    metric.name = "cpu"
+    metric.value = 4
+    metric.target_uid = "urn:host:1"
+    metric.tags = ["env:prod"]
+    factory.add_metric(metric)
+    assert len(factory.metrics) == 5 and len(factory.metrics.series) == 2
+    assert factory.metrics.to_receiver()[1:3] == [
+        ["cpu", 10, 2.0, {"hostname": "urn:host:1", "tags": ["env:prod"], "type": "gauge"}],
+        ["cpu", 20, 3.5, {"hostname": "urn:host:1", "tags": ["env:prod"], "type": "gauge"}],
+    ]
+    assert [(m.name, m.value, m.metric_type) for m in factory.metrics][3:] == [
+        ("requests", 7.0, "count"),
+        ("cpu", 4.0, "gauge"),
+    ]
+    with pytest.raises(Exception, match="not allowed"):
+        factory.add_metric_value("cpu", 1, metric_type="average")
+    with pytest.raises(Exception, match="one timestamp per value"):
+        factory.add_metric_values("cpu", [1, 2], timestamps=[1.0])
+    with pytest.raises(Exception, match="Metric 'cpu' value is required."):
+        factory.add_metric_value("cpu", None)
+    with pytest.raises(Exception, match="Metric 'cpu' value is required."):
+        factory.add_metric_values("cpu", [1, None])
+    assert len(factory.metrics) == 5
+
+    other = TopologyFactory()
+    other.add_metric_value("requests", 8, metric_type="count", target_uid="urn:host:2")
+    other.add_metric_value("disk", 9)
+    factory.merge(pickle.loads(pickle.dumps(other)))
+    assert len(factory.metrics) == 7 and len(factory.metrics.series) == 3
+    assert [row[0] for row in factory.metrics.to_receiver()[5:]] == ["requests", "disk"]
+
+
+def test_metric_buffer_publish(monkeypatch):
+    client = StackStateClient(StackStateSpec({"receiver_url": "http://localhost:7077", "api_key": "key"}))
+    factory = TopologyFactory()
+    factory.add_metric_values("cpu", [1, 2], target_uid="urn:host:1", timestamps=[10.0, 11.0])
+    stats = client.publish_metrics(factory.metrics, dry_run=True, stats=SyncStats())
+    assert stats.metrics == 2
+    assert json.loads(stats.payloads[0])["metrics"] == [
+        ["cpu", 10, 1.0, {"hostname": "urn:host:1", "tags": [], "type": "gauge"}],
+        ["cpu", 11, 2.0, {"hostname": "urn:host:1", "tags": [], "type": "gauge"}],
+    ]
+    stats = client.publish_metrics(list(factory.metrics), dry_run=True, stats=SyncStats())
+    assert json.loads(stats.payloads[0])["metrics"][0][:3] == ["cpu", 10, 1.0]
+
+
+def test_metric_buffer_memory_benchmark():
+    points = 20000
+
+    def models():
+        metrics = []
+        for i in range(points):
+            metric = Metric()
+            metric.name = "cpu"
+            metric.value = i
+            metric.target_uid = f"urn:host:{i % 100}"
+            metric.tags = ["env:prod"]
+            metrics.append(metric)
+        return metrics
+
+    def buffer():
+        factory = TopologyFactory()
+        for i in range(points):
+            factory.add_metric_value("cpu", i, tags=["env:prod"], target_uid=f"urn:host:{i % 100}")
+        return factory.metrics
+
+    model_metrics, model_size = _traced(models)
+    buffer_metrics, buffer_size = _traced(buffer)
+    assert len(model_metrics) == len(buffer_metrics) == points
+    logger.info(f"{points} metric points: models={model_size / 1e6:.1f}MB columnar={buffer_size / 1e6:.1f}MB")
+    assert buffer_size * 10 < model_size
+
+
+def test_metric_rollups():
+    buffer = MetricBuffer()
+    for i, value in enumerate([3, 1, 2]):
+        buffer.append("cpu", value, target_uid="urn:host:1", timestamp=100.0 + i)
+        buffer.append("cpu", value * 10, target_uid="urn:host:2", timestamp=100.0 - i)
+        buffer.append("disk.read", value, tags=["disk:sda"], target_uid="urn:host:1", timestamp=100.0)
+        buffer.append("requests", value, metric_type="count", target_uid="urn:host:1", timestamp=100.0)
+        buffer.append("latency", value, metric_type="histogram", target_uid="urn:host:1", timestamp=100.0)
+        buffer.append("memory", value, target_uid="urn:host:1", timestamp=100.0)
+    rollups = MetricRollups(
+        [
+            MetricRollup({"metric": "disk.*", "function": "max"}),
+            MetricRollup({"metric": "*", "metric_type": "count"}),
+            MetricRollup({"metric": "latency"}),
+            MetricRollup({"metric": "cpu"}),
+        ]
+    )
+    rows = rollups.apply(buffer).to_receiver()
+    assert [row[:3] for row in rows if row[0] == "memory"] == [
+        ["memory", 100, 3.0],
+        ["memory", 100, 1.0],
+        ["memory", 100, 2.0],
+    ]
+    rolled = {(row[0], row[3]["hostname"]): row[1:3] for row in rows if row[0] != "memory"}
+    assert rolled == {
+        ("cpu", "urn:host:1"): [102, 2.0],
+        ("cpu", "urn:host:2"): [100, 30.0],
+        ("disk.read", "urn:host:1"): [100, 3.0],
+        ("requests", "urn:host:1"): [100, 6.0],
+        ("latency.max", "urn:host:1"): [100, 3.0],
+        ("latency.median", "urn:host:1"): [100, 2.0],
+        ("latency.avg", "urn:host:1"): [100, 2.0],
+        ("latency.count", "urn:host:1"): [100, 3.0],
+        ("latency.95percentile", "urn:host:1"): [100, 3.0],
+    }
+    assert [row[3] for row in rows if row[0] == "disk.read"] == [
+        {"hostname": "urn:host:1", "tags": ["disk:sda"], "type": "gauge"}
+    ]
+    assert not MetricRollups([]) and len(MetricRollups([]).apply(buffer)) == len(buffer)
+
+
+def _event(event_type: str, title: str, identifiers: List[str], timestamp: Optional[float] = None) -> Event:
+    event = Event()
+    event.event_type = event_type
+    event.msg_title = title
+    event.msg_text = title
+    event.context.category = "Changes"
+    event.context.element_identifiers = identifiers
+    if timestamp is not None:
+        event.timestamp = datetime.fromtimestamp(timestamp, pytz.utc)
+    return event
+
+
+def test_event_buffer_deduplication():
+    buffer = EventBuffer(["event_type", "element_identifiers", "msg_title"])
+    for _ in range(3):
+        buffer.append(_event("restart", "Restarted", ["urn:host:1"]))
+    buffer.append(_event("restart", "Restarted", ["urn:host:2"]))
+    assert [e.context.element_identifiers for e in buffer] == [["urn:host:1"], ["urn:host:2"]]
+    assert (buffer.deduplicated, buffer.dropped) == (2, 0)
+
+    windowed = EventBuffer(["event_type", "element_identifiers"], dedup_window=60)
+    for timestamp in (0, 30, 59, 61, 100):
+        windowed.append(_event("restart", f"At {timestamp}", ["urn:host:1"], timestamp))
+    assert [e.msg_title for e in windowed] == ["At 0", "At 61"]
+    assert windowed.deduplicated == 3
+
+    unique = EventBuffer()
+    for _ in range(3):
+        unique.append(_event("restart", "Restarted", ["urn:host:1"]))
+    assert len(unique) == 3 and unique.deduplicated == 0
+
+
+def test_event_dedup_key_fields_are_checked_on_load():
+    with pytest.raises(Exception, match=r"fields \['msg_titel'\] not allowed"):
+        EventBuffer(["event_type", "msg_titel"])
+    conf = InstanceInfo({"event_dedup_key": ["event_type", "source", "msg_titel"]})
+    with pytest.raises(DataError) as e:
+        conf.validate()
+    assert list(e.value.to_primitive()["event_dedup_key"]) == [2]
+
+
+def test_event_buffer_limits():
+    newest = EventBuffer(max_size=2)
+    oldest = EventBuffer(["msg_title"], max_size=2, drop_policy=DROP_OLDEST)
+    for buffer in (newest, oldest):
+        for title in ("a", "b", "c", "d"):
+            buffer.append(_event("flap", title, ["urn:host:1"]))
+    assert [e.msg_title for e in newest] == ["a", "b"] and newest.dropped == 2
+    assert [e.msg_title for e in oldest] == ["c", "d"] and oldest.dropped == 2
+    # Evicted events no longer suppress their duplicates.
+    assert oldest.append(_event("flap", "a", ["urn:host:1"])) and [e.msg_title for e in oldest] == ["d", "a"]
+
+    factory = TopologyFactory()
+    factory.events = oldest
+    other = TopologyFactory()
+    other.events = oldest.empty()
+    for title in ("a", "e", "e"):
+        other.add_event(_event("flap", title, ["urn:host:1"]))
+    factory.merge(pickle.loads(pickle.dumps(other)))
+    assert [e.msg_title for e in factory.events] == ["a", "e"]
+    assert (factory.events.deduplicated, factory.events.dropped) == (2, 4)
@@ -0,0 +1,168 @@
+import logging
+import os
+import subprocess
+import sys
+
+from stackstate_etl.etl.interpreter import (
+    CODE,
+    CONSTANT,
+    JSONPATH,
+    BaseInterpreter,
+    CompiledTemplate,
+    ComponentTemplateInterpreter,
+    InterpreterPool,
+    MetricTemplateInterpreter,
+    TopologyContext,
+    expression_cache,
+)
+from stackstate_etl.etl.lazy import LazyImport
+from stackstate_etl.model.etl import ComponentTemplate, MetricTemplate
+from stackstate_etl.model.factory import TopologyFactory
+
+logger = logging.getLogger("stackstate_etl")
+
+HEAVY_LIBRARIES = ["pandas", "networkx", "pendulum", "pydash"]
+
+
+def test_expression_cache_parses_once():
+    expression_cache.clear()
+    interpreter = BaseInterpreter(TopologyContext(factory=TopologyFactory()))
+    for i in range(5):
+        interpreter.ctx.item = {"value": i}
+        assert interpreter._run_code("|item['value'] * 2", "value") == i * 2
+    info = expression_cache.info()
+    assert info["misses"] == 1
+    assert info["hits"] == 4
+    assert info["size"] == 1
+
+
+def test_expression_cache_reports_errors():
+    interpreter = BaseInterpreter(TopologyContext(factory=TopologyFactory()))
+    interpreter.ctx.item = {}
+    for _ in range(2):
+        try:
+            interpreter._run_code("|item['missing']", "value")
+            assert False, "Expected evaluation to fail"
+        except Exception as e:
+            assert "Failed to evaluate property 'value'" in str(e)
+
+
+def test_interpreter_pool_reuses_and_resets():
+    pool = InterpreterPool()
+    ctx = TopologyContext(factory=TopologyFactory())
+    first = BaseInterpreter(ctx, pool)
+    first._run_code("leaked = 42", "code")
+    aeval = first.aeval
+    first.release()
+
+    second = BaseInterpreter(ctx, pool)
+    assert second.aeval is aeval
+    assert "leaked" not in second.aeval.symtable
+    assert second.aeval.symtable["factory"] is ctx.factory
+    assert second._run_code("|re.sub('a', 'b', 'aa')", "code") == "bb"
+    second.release()
+    assert pool.created == 1
+
+
+def test_interpreter_pool_keeps_interpreters_with_functions():
+    pool = InterpreterPool()
+    ctx = TopologyContext(factory=TopologyFactory(), session={})
+    processor = BaseInterpreter(ctx, pool)
+    processor._run_code("def double(x):\n    return x * factor\nfactor = 2\nsession['double'] = double", "code")
+    processor.release()
+    assert len(pool.available) == 0
+
+    template = BaseInterpreter(ctx, pool)
+    assert template._run_code("|session['double'](21)", "code") == 42
+    template.release()
+
+
+def test_compiled_template_classifies_fields_once():
+    template = ComponentTemplate(
+        {
+            "name": "host",
+            "selector": "|item['kind'] == 'host'",
+            "spec": {
+                "name": "$.name",
+                "type": "host",
+                "uid": "|uid('test', 'host', item['name'])",
+                "labels": "|['a', 'b']",
+                "custom_properties": {"ip": "$.ip", "static": 0},
+            },
+        }
+    )
+    compiled = CompiledTemplate(template)
+    assert compiled.selector.kind == CODE
+    assert compiled.spec.name.kind == JSONPATH
+    assert compiled.spec.component_type.kind == CONSTANT
+    assert compiled.spec.uid.code == "uid('test', 'host', item['name'])"
+    assert compiled.spec.labels.kind == CODE
+    assert compiled.spec.custom_properties["ip"].kind == JSONPATH
+    assert compiled.spec.custom_properties["static"].kind == CONSTANT
+
+    factory = TopologyFactory()
+    interpreter = ComponentTemplateInterpreter(
+        TopologyContext(factory=factory), template, "domain", "layer", "env", compiled=compiled
+    )
+    item = {"kind": "host", "name": "h1", "ip": "10.0.0.1"}
+    assert interpreter.active(item)
+    component = interpreter.interpret(item)
+    assert component.uid == "urn:test:host:/h1"
+    assert component.properties.labels == ["a", "b"]
+    assert component.properties.custom_properties == {"ip": "10.0.0.1", "static": 0}
+
+
+def test_metric_spec_expressions_read_the_current_metric():
+    template = MetricTemplate(
+        {
+            "name": "cpu",
+            "spec": {
+                "name": "$.metric",
+                "metric_type": "gauge",
+                "value": "$.value",
+                "target_uid": "|'urn:host:' + item['host']",
+                "tags": "|[f'metric:{metric.name}', f'target:{metric.target_uid}']",
+            },
+        }
+    )
+    factory = TopologyFactory()
+    interpreter = MetricTemplateInterpreter(
+        TopologyContext(factory=factory), template, "domain", "layer", "env", compiled=CompiledTemplate(template)
+    )
+    for host in ["h1", "h2"]:
+        interpreter.interpret({"metric": f"cpu.{host}", "value": 1, "host": host})
+    assert [m.tags for m in factory.metrics] == [
+        ["metric:cpu.h1", "target:urn:host:h1"],
+        ["metric:cpu.h2", "target:urn:host:h2"],
+    ]
+    try:
+        interpreter.interpret({"metric": "cpu", "value": None, "host": "h3"})
+        assert False, "Expected a missing value to fail"
+    except Exception as e:
+        assert str(e) == "Template cpu metric value is required."
+    assert len(factory.metrics) == 2
+
+
+def test_lazy_libraries_resolve_on_first_use():
+    interpreter = BaseInterpreter(TopologyContext(factory=TopologyFactory()))
+    interpreter.ctx.item = {}
+    assert interpreter._run_code("|str(pytz.utc)", "value") == "UTC"
+    assert interpreter._run_code("|datetime.datetime(2022, 1, 1, tzinfo=pytz.utc).year", "value") == 2022
+    missing = LazyImport("stackstate_etl_missing_module")
+    assert not missing
+    try:
+        missing.anything
+        assert False, "Expected an ImportError"
+    except ImportError:
+        pass
+
+
+def test_cli_import_skips_heavy_libraries():
+    code = (
+        "import sys\n"
+        "import stackstate_etl.cli.main\n"
+        f"print([m for m in {HEAVY_LIBRARIES!r} if m in sys.modules])\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, env=env).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,101 @@
+import logging
+import sys
+
+import yaml
+from jsonpath_ng import parse
+
+from stackstate_etl.etl.interpreter import DataSourceInterpreter, TopologyContext
+from stackstate_etl.model.etl import ETL
+from stackstate_etl.model.factory import SimpleJsonPath, TopologyFactory, find_values
+from stackstate_etl.model.instance import InstanceInfo
+
+logging.basicConfig()
+logger = logging.getLogger("stackstate_etl")
+logger.setLevel(logging.INFO)
+
+HOST_PATHS = [
+    "$.spec.name",
+    "$.status.state",
+    "$.status.resources.hypervisor.ip",
+    "$.status.resources.host_disks_reference_list[1].uuid",
+    "$.status.resources.controller_vm.oplog_usage.oplog_disk_pct",
+    "$.metadata.missing",
+]
+
+
+def _load_sample_hosts():
+    with open("./tests/1_sample_host_etl.yaml") as f:
+        etl = ETL(yaml.safe_load(f)["etl"])
+    ctx = TopologyContext(factory=TopologyFactory(), datasources={})
+    generate_data = DataSourceInterpreter(ctx).interpret(etl.datasources[0], InstanceInfo())
+    return generate_data()
+
+
+def test_simple_paths_use_fast_path():
+    for path in ["$.a", "$.a.b", "$['a'].b", "$.a[0].b", "$.a-b[2]"]:
+        assert isinstance(SimpleJsonPath.from_expression(parse(path)), SimpleJsonPath), path
+    for path in ["$.a[*]", "$.a.*", "$..a", "$.a[-1]", "$.a[0:2]", "$.a[0,1]", "$.a.`this`"]:
+        assert SimpleJsonPath.from_expression(parse(path)) is None, path
+
+
+def test_fast_path_matches_jsonpath_ng():
+    targets = [
+        {"a": None},
+        {},
+        {"a": []},
+        {"a": {"0": 1}},
+        {"a": [{"b": 1}, {"b": 2}]},
+        {"a": "str"},
+        {"a": [1, 2]},
+        {"a": ("x", "y")},
+        {"a": {"b": [{"c": 3}]}},
+        [1],
+    ]
+    paths = ["$.a", "$.a.b", "$.a[0]", "$.a[1]", "$.a[5]", "$.a.b[0].c"]
+    for path in paths:
+        expression = parse(path)
+        fast_path = SimpleJsonPath.from_expression(expression)
+        for target in targets:
+            assert fast_path.find_value(target, "default") == find_values(expression, target, "default"), (path, target)
+
+
+def _python_calls(run) -> int:
+    """Number of Python function calls made by `run`, a measure of work that does not depend on machine load."""
+    calls = [0]
+
+    def profile(frame, event, arg):
+        if event == "call":
+            calls[0] += 1
+
+    sys.setprofile(profile)
+    try:
+        run()
+    finally:
+        sys.setprofile(None)
+    return calls[0]
+
+
+def test_jpath_fast_path_benchmark():
+    hosts = _load_sample_hosts()
+    factory = TopologyFactory()
+    expressions = [parse(path) for path in HOST_PATHS]
+    fast_paths = [SimpleJsonPath.from_expression(expression) for expression in expressions]
+
+    def slow():
+        for host in hosts:
+            for expression in expressions:
+                find_values(expression, host)
+
+    def fast():
+        for host in hosts:
+            for fast_path in fast_paths:
+                fast_path.find_value(host)
+
+    for host in hosts:
+        for path, expression in zip(HOST_PATHS, expressions):
+            assert factory.jpath(path, host) == find_values(expression, host)
+
+    slow_calls = _python_calls(slow)
+    fast_calls = _python_calls(fast)
+    logger.info(f"jpath calls jsonpath_ng={slow_calls} fast_path={fast_calls} ratio={slow_calls / fast_calls:.1f}x")
+    assert fast_calls * 10 < slow_calls
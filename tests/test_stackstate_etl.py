@@ -1,8 +1,15 @@
-from stackstate_etl.model.instance import InstanceInfo
+from stackstate_etl.model.instance import CliConfiguration, InstanceInfo
+from stackstate_etl.cli.cli_processor import CliProcessor
 from stackstate_etl.model.etl import ETL
 from stackstate_etl.model.factory import TopologyFactory
-from stackstate_etl.etl.etl_driver import ETLDriver
+from stackstate_etl.etl.etl_driver import ETLDriver, ETLProcessor
+from stackstate_etl.etl.interpreter import TopologyContext
+from stackstate_etl.etl import model_cache
+import asyncio
 import logging
+import threading
+
+import pytest
 
 logging.basicConfig()
 logger = logging.getLogger("stackstate_etl")
@@ -22,3 +29,471 @@ def test_processing_sample():
     assert len(factory.relations) == 1
     assert len(factory.health) == 1
     assert len(factory.metrics) == 2
+
+
+def test_processing_sample_with_item_dispatch():
+    conf = InstanceInfo()
+    conf.etl = ETL()
+    conf.etl.refs = ["file://./tests/1_sample_host_etl.yaml", "file://./tests/2_sample_disk_etl.yaml"]
+    factory = TopologyFactory()
+    driver = ETLDriver(conf, factory, logger)
+    for model in driver.models:
+        for query in model.queries:
+            query.dispatch = "item"
+    driver.process()
+    assert len(factory.components) == 2
+    component = factory.get_component(factory.get_uid("nutanix", "host", "ed5edbbb-7428-4066-ae90-1270dcca2f37"))
+    assert "processor:label" in component.properties.labels
+    assert len(factory.relations) == 1
+    assert len(factory.health) == 1
+    assert len(factory.metrics) == 2
+
+
+def _field_selector_etl(dispatch: str) -> ETL:
+    return ETL(
+        {
+            "queries": [
+                {
+                    "name": "inventory",
+                    "query": "|[{'kind': 'vm', 'name': 'vm1'}, {'kind': 'host', 'name': 'h1'}, {'kind': ['x']}]",
+                    "dispatch": dispatch,
+                    "template_refs": ["vm_template", "host_template", "all_template"],
+                }
+            ],
+            "template": {
+                "components": [
+                    {
+                        "name": "vm_template",
+                        "selector": {"field": "kind", "values": ["vm"]},
+                        "spec": {"name": "$.name", "type": "vm", "uid": "|'urn:vm:' + item['name']"},
+                    },
+                    {
+                        "name": "host_template",
+                        "selector": {"field": "$.kind", "values": ["host", "hypervisor"]},
+                        "spec": {"name": "$.name", "type": "host", "uid": "|'urn:host:' + item['name']"},
+                    },
+                ],
+                "processors": [
+                    {"name": "all_template", "selector": "|'name' in item", "code": "session['count'] += 1"},
+                ],
+            },
+            "pre_processors": [{"name": "init", "code": "session['count'] = 0"}],
+        }
+    )
+
+
+def test_processing_field_selectors():
+    for dispatch in ["template", "item"]:
+        conf = InstanceInfo()
+        conf.etl = _field_selector_etl(dispatch)
+        factory = TopologyFactory()
+        driver = ETLDriver(conf, factory, logger)
+        index = driver.template_lookup.selector_index(conf.etl.queries[0].template_refs)
+        assert index.indexed == {0, 1}
+        assert index.route(factory, {"kind": "hypervisor"}) == {1}
+        driver.process()
+        assert factory.get_component("urn:vm:vm1").get_type() == "vm"
+        assert factory.get_component("urn:host:h1").get_type() == "host"
+        assert len(factory.components) == 2
+
+
+class BarrierClient:
+    barrier = threading.Barrier(2, timeout=5)
+
+    def fetch(self, name):
+        # Only passes when both queries are running at the same time.
+        self.barrier.wait()
+        return [{"name": f"{name}-{i}"} for i in range(3)]
+
+
+def test_processing_concurrent_queries():
+    conf = InstanceInfo()
+    conf.query_concurrency = 2
+    conf.etl = ETL(
+        {
+            "datasources": [
+                {
+                    "name": "client",
+                    "module": "tests.test_stackstate_etl",
+                    "cls": "BarrierClient",
+                    "init": "BarrierClient()",
+                }
+            ],
+            "queries": [
+                {"name": "first", "query": "client.fetch('first')", "template_refs": ["collect"]},
+                {"name": "second", "query": "client.fetch('second')", "template_refs": ["collect"]},
+            ],
+            "template": {"processors": [{"name": "collect", "code": "global_session['names'].append(item['name'])"}]},
+        }
+    )
+    driver = ETLDriver(conf, TopologyFactory(), logger)
+    global_session = {"names": []}
+    processor = ETLProcessor(conf.etl, driver.template_lookup, conf, driver.factory, logger, driver.interpreter_pool)
+    processor.process(TopologyContext(factory=driver.factory, datasources={}, global_session=global_session))
+    assert global_session["names"] == [f"first-{i}" for i in range(3)] + [f"second-{i}" for i in range(3)]
+
+
+def _parallel_etl() -> ETL:
+    return ETL(
+        {
+            "queries": [
+                {
+                    "name": "hosts",
+                    "query": "|[{'name': 'h%s' % i, 'rack': 'r%s' % (i % 3)} for i in range(20)]",
+                    "parallel": True,
+                    "template_refs": ["host", "rack", "host_metric", "host_health"],
+                }
+            ],
+            "template": {
+                "components": [
+                    {
+                        "name": "host",
+                        "spec": {"name": "$.name", "type": "host", "uid": "|'urn:host:' + item['name']"},
+                    },
+                    {
+                        "name": "rack",
+                        "spec": {
+                            "name": "$.rack",
+                            "type": "rack",
+                            "uid": "|'urn:rack:' + item['rack']",
+                            "identifiers": ["|'urn:host:' + item['name']"],
+                            "mergeable": True,
+                        },
+                    },
+                ],
+                "metrics": [
+                    {
+                        "name": "host_metric",
+                        "spec": {
+                            "name": "up",
+                            "metric_type": "gauge",
+                            "value": "1",
+                            "target_uid": "|'urn:host:' + item['name']",
+                        },
+                    }
+                ],
+                "health": [
+                    {
+                        "name": "host_health",
+                        "spec": {
+                            "check_id": "|item['name']",
+                            "check_name": "up",
+                            "topo_identifier": "|'urn:host:' + item['name']",
+                            "health": "CLEAR",
+                        },
+                    }
+                ],
+            },
+        }
+    )
+
+
+def test_processing_parallel_shards():
+    results = []
+    for workers in [1, 4]:
+        conf = InstanceInfo()
+        conf.template_workers = workers
+        conf.factory_mode = "Lenient"
+        conf.etl = _parallel_etl()
+        factory = TopologyFactory(mode="Lenient")
+        driver = ETLDriver(conf, factory, logger)
+        # Rack components are never finalised by a non mergeable template.
+        factory.mode = "Ignore"
+        driver.process()
+        results.append(factory)
+    sequential, parallel = results
+    assert len(parallel.components) == 23
+    for uid, component in sequential.components.items():
+        assert parallel.get_component(uid).to_primitive() == component.to_primitive()
+    assert [m.target_uid for m in parallel.metrics] == [m.target_uid for m in sequential.metrics]
+    assert list(parallel.health.keys()) == list(sequential.health.keys())
+
+
+def test_parallel_shards_reject_concurrent_queries():
+    conf = InstanceInfo()
+    conf.template_workers = 4
+    conf.query_concurrency = 2
+    conf.etl = _parallel_etl()
+    with pytest.raises(Exception, match="cannot be parallel when query_concurrency is above 1"):
+        ETLDriver(conf, TopologyFactory(), logger)
+
+
+class StreamingClient:
+    def __init__(self, factory):
+        self.factory = factory
+
+    def hosts(self):
+        for i in range(5):
+            if i > 0:
+                # The previous item went through the templates before the next one is pulled.
+                assert self.factory.component_exists(f"urn:host:h{i - 1}")
+            yield {"name": f"h{i}"}
+
+
+def test_processing_streamed_query_results():
+    conf = InstanceInfo()
+    conf.etl = ETL(
+        {
+            "datasources": [
+                {
+                    "name": "client",
+                    "module": "tests.test_stackstate_etl",
+                    "cls": "StreamingClient",
+                    "init": "StreamingClient(factory)",
+                }
+            ],
+            "queries": [{"name": "hosts", "query": "client.hosts()", "template_refs": ["host"]}],
+            "template": {
+                "components": [
+                    {"name": "host", "spec": {"name": "$.name", "type": "host", "uid": "|'urn:host:' + item['name']"}}
+                ]
+            },
+        }
+    )
+    factory = TopologyFactory()
+    ETLDriver(conf, factory, logger).process()
+    assert len(factory.components) == 5
+
+
+class PagedClient:
+    def __init__(self):
+        self.fetched = []
+
+    def fetch_page(self, token):
+        token = token or 0
+        self.fetched.append(token)
+        next_token = token + 1 if token < 2 else None
+        return [{"name": f"h{token}-{i}"} for i in range(2)], next_token
+
+
+def test_processing_paged_query_results():
+    client = PagedClient()
+    conf = InstanceInfo()
+    conf.etl = ETL(
+        {
+            "queries": [
+                {"name": "hosts", "query": "client", "template_refs": ["host"]},
+                {
+                    "name": "more_hosts",
+                    "query": "paged(client.fetch_page)",
+                    "prefetch": False,
+                    "template_refs": ["host"],
+                },
+            ],
+            "template": {
+                "components": [
+                    {"name": "host", "spec": {"name": "$.name", "type": "host", "uid": "|'urn:host:' + item['name']"}}
+                ]
+            },
+        }
+    )
+    factory = TopologyFactory(mode="Lenient")
+    driver = ETLDriver(conf, factory, logger)
+    processor = ETLProcessor(conf.etl, driver.template_lookup, conf, factory, logger, driver.interpreter_pool)
+    processor.process(TopologyContext(factory=factory, datasources={"client": client}))
+    assert client.fetched == [0, 1, 2, 0, 1, 2]
+    assert len(factory.components) == 6
+
+
+class AsyncClient:
+    def __init__(self):
+        self.started = set()
+
+    @classmethod
+    async def connect(cls):
+        await asyncio.sleep(0)
+        return cls()
+
+    async def fetch(self, name, other):
+        self.started.add(name)
+        # Only completes when the other query is awaited on the same loop at the same time.
+        for _ in range(100):
+            if other in self.started:
+                return [{"name": f"{name}-{i}"} for i in range(2)]
+            await asyncio.sleep(0)
+        raise Exception(f"Query '{other}' did not run concurrently with '{name}'.")
+
+    async def hosts(self):
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield {"name": f"streamed-{i}"}
+
+
+def test_processing_async_queries():
+    conf = InstanceInfo()
+    conf.async_queries = True
+    conf.etl = ETL(
+        {
+            "datasources": [
+                {
+                    "name": "client",
+                    "module": "tests.test_stackstate_etl",
+                    "cls": "AsyncClient",
+                    "init": "AsyncClient.connect()",
+                }
+            ],
+            "queries": [
+                {"name": "first", "query": "client.fetch('first', 'second')", "template_refs": ["host"]},
+                {"name": "second", "query": "client.fetch('second', 'first')", "template_refs": ["host"]},
+                {"name": "streamed", "query": "client.hosts()", "template_refs": ["host"]},
+            ],
+            "template": {
+                "components": [
+                    {"name": "host", "spec": {"name": "$.name", "type": "host", "uid": "|'urn:host:' + item['name']"}}
+                ]
+            },
+        }
+    )
+    factory = TopologyFactory()
+    driver = ETLDriver(conf, factory, logger)
+    try:
+        driver.process()
+    finally:
+        driver.close()
+    assert len(factory.components) == 7
+
+
+class CountingClient:
+    created = 0
+
+    def __init__(self):
+        CountingClient.created += 1
+
+    def hosts(self):
+        return [{"name": f"h{i}"} for i in range(2)]
+
+
+def test_processing_warm_driver_cycles():
+    conf = InstanceInfo()
+    conf.etl = ETL(
+        {
+            "datasources": [
+                {
+                    "name": "client",
+                    "module": "tests.test_stackstate_etl",
+                    "cls": "CountingClient",
+                    "init": "CountingClient()",
+                }
+            ],
+            "queries": [{"name": "hosts", "query": "client.hosts()", "template_refs": ["host"]}],
+            "template": {
+                "components": [
+                    {"name": "host", "spec": {"name": "$.name", "type": "host", "uid": "|'urn:host:' + item['name']"}}
+                ]
+            },
+        }
+    )
+    driver = ETLDriver(conf, TopologyFactory(), logger)
+    for _ in range(3):
+        factory = TopologyFactory()
+        driver.reset(factory)
+        driver.process()
+        assert len(factory.components) == 2
+    driver.close()
+    assert CountingClient.created == 1
+
+
+def test_model_cache(tmp_path, monkeypatch):
+    with open("tests/1_sample_host_etl.yaml") as f:
+        sample = f.read()
+    etl_file = tmp_path / "hosts.yaml"
+    etl_file.write_text(sample)
+    conf = InstanceInfo()
+    conf.model_cache_dir = str(tmp_path / "cache")
+    conf.etl = ETL({"refs": [f"file://{etl_file}"]})
+    cold = ETLDriver(conf, TopologyFactory(), logger)
+    warm = ETLDriver(conf, TopologyFactory(), logger)
+    assert (cold.model_cache.hits, cold.model_cache.misses) == (0, 1)
+    assert (warm.model_cache.hits, warm.model_cache.misses) == (1, 0)
+    assert [m.to_primitive() for m in warm.models] == [m.to_primitive() for m in cold.models]
+
+    etl_file.write_text(sample.replace("nutanix", "acropolis"))
+    changed = ETLDriver(conf, TopologyFactory(), logger)
+    assert (changed.model_cache.hits, changed.model_cache.misses) == (0, 1)
+    assert "acropolis" in str(changed.models[0].to_primitive())
+
+    # Entries stored with another ETL model schema, e.g. before a package upgrade, are not used.
+    monkeypatch.setattr(model_cache, "_schema_hash", "other")
+    assert ETLDriver(conf, TopologyFactory(), logger).model_cache.misses == 1
+    monkeypatch.undo()
+    assert ETLDriver(conf, TopologyFactory(), logger).model_cache.misses == 1
+
+    for entry in (tmp_path / "cache").iterdir():
+        entry.write_bytes(b"corrupt")
+    assert ETLDriver(conf, TopologyFactory(), logger).model_cache.misses == 1
+
+
+def test_processing_metric_rollups():
+    conf = InstanceInfo()
+    conf.etl = ETL(
+        {
+            "queries": [
+                {
+                    "name": "samples",
+                    "query": "|[{'host': 'h1', 'load': v} for v in [1, 5, 3]] + [{'host': 'h2', 'load': 4}]",
+                    "template_refs": ["load"],
+                }
+            ],
+            "template": {
+                "metrics": [
+                    {
+                        "name": "load",
+                        "spec": {
+                            "name": "system.load",
+                            "metric_type": "gauge",
+                            "value": "$.load",
+                            "target_uid": "|'urn:host:' + item['host']",
+                        },
+                    }
+                ]
+            },
+            "metric_rollups": [{"metric": "system.*", "function": "max"}],
+        }
+    )
+    factory = TopologyFactory()
+    ETLDriver(conf, factory, logger).process()
+    assert sorted((m.target_uid, m.value) for m in factory.metrics) == [("urn:host:h1", 5.0), ("urn:host:h2", 4.0)]
+
+
+def test_cli_dry_run_reports_event_buffer_counters():
+    conf = CliConfiguration(
+        {
+            "stackstate": {
+                "receiver_url": "http://localhost:7077",
+                "api_key": "key",
+                "health_sync": {"stream_id": "etl"},
+            },
+            "event_dedup_key": ["event_type", "element_identifiers"],
+            "max_events": 2,
+            "etl": {
+                "queries": [
+                    {
+                        "name": "restarts",
+                        "query": "|[{'host': h} for h in ['h1', 'h1', 'h2', 'h1', 'h3']]",
+                        "template_refs": ["restart"],
+                    }
+                ],
+                "template": {
+                    "events": [
+                        {
+                            "name": "restart",
+                            "spec": {
+                                "category": "Changes",
+                                "event_type": "restart",
+                                "msg_title": "|'Restarted ' + item['host']",
+                                "msg_text": "Restarted",
+                                "element_identifiers": "|['urn:host:' + item['host']]",
+                                "source_links": [],
+                            },
+                        }
+                    ]
+                },
+            },
+        }
+    )
+    processor = CliProcessor(conf)
+    try:
+        stats = processor.run(dry_run=True)
+    finally:
+        processor.close()
+    assert (stats.events, stats.events_deduplicated, stats.events_dropped) == (2, 2, 1)